@@ -1,3 +1,3 @@
-from pygliss import constants, note, utils, chord, gliss, gliss_cmpr, mus21, sequence
+from pygliss import constants, note, utils, roughness, bitset, tables, result_cache, chord, chord_index, fingerprint, dtw, voice_leading, gliss, gliss_cmpr, mus21, sequence
 
-__all__ = [constants, note, utils, chord, gliss, gliss_cmpr, mus21, sequence]
\ No newline at end of file
+__all__ = [constants, note, utils, roughness, bitset, tables, result_cache, chord, chord_index, fingerprint, dtw, voice_leading, gliss, gliss_cmpr, mus21, sequence]
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Fixed width bitsets of quantized steps
+
+Every chord, FM spectrum or overtone series quantized to NOTE_VECTOR fits in
+`N_WORDS` uint64 words, one bit per step. Bit 0 stands for out of range
+tones, the quantizer never returns position 0. Intersection, union,
+containment and common tone counts become a few word operations instead of
+sorting the step arrays.
+"""
+import numpy as np
+
+from pygliss.note import NOTE_VECTOR, find_note_vector_position_vectorized
+
+
+N_WORDS = (len(NOTE_VECTOR) + 63) // 64
+N_BITS = N_WORDS * 64
+
+if hasattr(np, "bitwise_count"):
+    def _word_counts(words):
+        return np.bitwise_count(words)
+else:
+    # numpy < 2.0 has no popcount ufunc, count the bytes with a lookup table
+    _BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)],
+        dtype=np.uint8)
+
+    def _word_counts(words):
+        words = np.ascontiguousarray(words, dtype="<u8")
+        counts = _BYTE_COUNTS[words.view(np.uint8)]
+        return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def popcount(words):
+    """Returns the number of set bits of every bitset, summed over the words"""
+    return _word_counts(words).sum(axis=-1, dtype=np.int64)
+
+
+def step_slots(steps):
+    """Returns the bit of each step, out of range steps go to bit 0"""
+    steps = np.asarray(steps, dtype=np.int64)
+    return np.where(steps < 0, 0, steps)
+
+
+class ChordBitset:
+    """
+    A class to represent sets of quantized steps as bitsets
+
+    Holds any number of bitsets in an array of shape (..., N_WORDS), every
+    operation is applied to all of them at once and broadcasts like numpy.
+
+    ...
+
+    Attributes
+    ----------
+        words : numpy.ndarray[numpy.uint64]
+            the bitsets, bit `s % 64` of word `s // 64` is set when step `s`
+            is in the set
+
+
+    Methods
+    -------
+        from_steps(steps, mask=None)
+            builds the bitsets of the rows of a step array
+
+        from_freq(freq, mask=None)
+            builds the bitsets of the rows of a frequency array
+
+        count()
+            returns the number of steps in every set
+
+        contains(other)
+            returns True where every step of `other` is in the set
+
+        common_tones(other)
+            returns the number of steps shared with `other`
+
+        steps()
+            returns the sorted steps of a single set
+
+    """
+    def __init__(self, words):
+        """
+        Contructs ChordBitset
+
+        Parameters
+        ----------
+            words : numpy.ndarray[numpy.uint64]
+                bitsets of shape (..., N_WORDS)
+        """
+        self.words = np.asarray(words, dtype=np.uint64)
+
+    @classmethod
+    def from_steps(cls, steps, mask=None):
+        """
+        Builds the bitsets of the last axis of `steps`
+
+        Parameters
+        ----------
+            steps : numpy.ndarray[numpy.int64]
+                quantized steps, -999999 and FM_STEP_SENTINEL are stored as
+                bit 0
+            mask : numpy.ndarray[bool]
+                the steps in use when `steps` is padded, all of them if not
+                specified
+        """
+        slots = step_slots(steps)
+        if mask is not None:
+            # padding goes to an extra bit that is dropped
+            slots = np.where(mask, slots, N_BITS)
+        if slots.ndim == 1:
+            onehot = np.zeros(N_BITS + 1, dtype=bool)
+            onehot[slots] = True
+            return cls(np.packbits(onehot[:N_BITS], bitorder="little").view("<u8"))
+        shape = slots.shape[:-1]
+        slots = slots.reshape(int(np.prod(shape)), slots.shape[-1])
+        onehot = np.zeros((len(slots), N_BITS + 1), dtype=bool)
+        onehot[np.arange(len(slots))[:, np.newaxis], slots] = True
+        words = np.packbits(onehot[:, :N_BITS], axis=1, bitorder="little")
+        return cls(words.view("<u8").reshape(shape + (N_WORDS,)))
+
+    @classmethod
+    def from_freq(cls, freq, mask=None):
+        """Builds the bitsets of the last axis of a frequency array"""
+        return cls.from_steps(find_note_vector_position_vectorized(freq), mask)
+
+    def __and__(self, other):
+        return ChordBitset(self.words & other.words)
+
+    def __or__(self, other):
+        return ChordBitset(self.words | other.words)
+
+    def __eq__(self, other):
+        return np.all(self.words == other.words, axis=-1)
+
+    def __getitem__(self, idx):
+        return ChordBitset(self.words[idx])
+
+    @property
+    def shape(self):
+        return self.words.shape[:-1]
+
+    def count(self):
+        """Returns the number of steps in every set"""
+        return popcount(self.words)
+
+    def contains(self, other):
+        """Returns True where every step of `other` is also in the set"""
+        return np.all(self.words & other.words == other.words, axis=-1)
+
+    def common_tones(self, other):
+        """Returns the number of steps shared with `other`"""
+        return popcount(self.words & other.words)
+
+    def steps(self):
+        """Returns the sorted steps of a single set"""
+        words = np.ascontiguousarray(self.words, dtype="<u8")
+        if words.shape != (N_WORDS,):
+            raise ValueError("steps() needs a single bitset")
+        return np.flatnonzero(np.unpackbits(words.view(np.uint8),
+            bitorder="little"))
@@ -1,9 +1,18 @@
 from pygliss.note import freq_to_note, find_note_vector_position_vectorized, NOTE_VECTOR, NOTE_VECTOR_12
-from pygliss.constants import LOW, HIGH, MAX_CHORD_LENGTH
-
-import itertools
+from pygliss.constants import LOW, HIGH, MAX_SIDEBANDS, DEFAULT_MAX_BYTES
+from pygliss.tables import (fm_spectra, fm_spectra_steps, expand_steps, 
+    fm_sideband_steps, fm_sideband_step_index, fm_roughness, fm_tone_rows, 
+    fm_sideband_bitsets, sideband_count, harmonic_steps, lookup_harmonic_steps, 
+    SharedTables, FREQ_MODULATORS, 
+    FM_SUM_ROWS, FM_DIFF_ROWS, FM_TONE_ROWS, FM_STEP_SENTINEL)
+from pygliss.roughness import calc_roughness, spectral_roughness
+from pygliss.bitset import ChordBitset
+from pygliss.result_cache import get_result_cache, result_key
+
+import copy
 import numpy as np
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 
 class Chord:
@@ -101,7 +110,7 @@ class Chord:
             note_objs.append(n)
         return note_objs
 
-    def distance(self, in_chord):
+    def distance(self, in_chord, doublecount=True):
         """
         Returns stepwise distance from self to input chord `in_chord`
         Notes can be double counted, for every note, the closest is found
@@ -110,6 +119,9 @@ class Chord:
         ----------
             in_chord : pygliss.Chord
                 the input chord
+            doublecount : bool
+                set to False to pair every note with a distinct note, see 
+                `get_chord_distance`
 
         Returns
         -------
@@ -117,6 +129,8 @@ class Chord:
                 The stepwise distance between two chords
 
         """
+        if not doublecount:
+            return get_chord_distance(self.steps, in_chord.steps, doublecount)
         smaller, larger, dist = self.steps, in_chord.steps, 0
         if self.length > in_chord.length:
             smaller = in_chord.steps
@@ -194,38 +208,46 @@ class OvertoneChord(Chord):
         """
 
         note_positions = find_note_vector_position_vectorized(self.notes)
-        partials = self.get_partials(m=m, include_fund=True)
-        ot_positions = find_note_vector_position_vectorized(partials)
-        tones, _, ot =  np.intersect1d(note_positions, ot_positions, return_indices=True)
+        fund_position = find_note_vector_position_vectorized(
+            np.array([self.fundamental], dtype=np.float64))[0]
+        if fund_position > 0 and NOTE_VECTOR[fund_position] == self.fundamental:
+            # tempered fundamentals are read from the harmonic series table
+            ot_positions = expand_steps(harmonic_steps(m)[fund_position])
+        else:
+            partials = self.get_partials(m=m, include_fund=True)
+            ot_positions = find_note_vector_position_vectorized(partials)
+        tones, ot = common_tones(note_positions, ot_positions)
         if return_partials:
             return ot + 1
         return NOTE_VECTOR[tones]
 
 
 
-MAX_SIDEBANDS = 30
-FREQ_MODULATORS = np.outer(np.arange(1, MAX_SIDEBANDS+1), NOTE_VECTOR)
-SUM_TONES = np.zeros((len(NOTE_VECTOR), MAX_SIDEBANDS, len(NOTE_VECTOR)))
-DIFF_TONES = np.zeros((len(NOTE_VECTOR), MAX_SIDEBANDS, len(NOTE_VECTOR)))
-FM_CHORDS = np.zeros((len(NOTE_VECTOR), MAX_SIDEBANDS * 2, len(NOTE_VECTOR)))
-FM_CHORDS_W_CARRIER = np.zeros((len(NOTE_VECTOR), ((MAX_SIDEBANDS * 2) + 1), len(NOTE_VECTOR)))
-
-for i in range(len(NOTE_VECTOR)):
-    SUM_TONES[i] = NOTE_VECTOR[i] + FREQ_MODULATORS
-    DIFF_TONES[i] = np.abs(NOTE_VECTOR[i] - FREQ_MODULATORS)
-    FM_CHORDS[i] = np.vstack((SUM_TONES[i], DIFF_TONES[i]))
-    carrier = np.ones(len(NOTE_VECTOR)) * NOTE_VECTOR[i]
-    FM_CHORDS_W_CARRIER[i] = np.vstack((FM_CHORDS[i], carrier))
+# The FM lookup tables are views of the compact tables in `pygliss.tables`,
+# which are built on first access. The step tables are kept as int16 with 
+# out of range tones marked by `FM_STEP_SENTINEL`, their legacy names return 
+# int64 copies with -999999 like `find_note_vector_position_vectorized`
+FM_TABLES = {
+    "SUM_TONES":(fm_spectra, FM_SUM_ROWS, None),
+    "DIFF_TONES":(fm_spectra, FM_DIFF_ROWS, None),
+    "FM_CHORDS":(fm_spectra, FM_TONE_ROWS, None),
+    "FM_CHORDS_W_CARRIER":(fm_spectra, slice(None), None),
+    "FM_CHORDS_STEPS":(fm_spectra_steps, FM_TONE_ROWS, expand_steps),
+    "FM_CHORDS_W_CARRIER_STEPS":(fm_spectra_steps, slice(None), expand_steps),
+}
 
+# results of `nearest_fm_chord` and `nearest_ot_chord`, kept in memory and 
+# optionally on disk, see `pygliss.result_cache`
+FM_RESULTS = get_result_cache("nearest_fm_chord")
+OT_RESULTS = get_result_cache("nearest_ot_chord")
 
-FM_CHORDS_STEPS = find_note_vector_position_vectorized(FM_CHORDS)
-FM_CHORDS_W_CARRIER_STEPS = find_note_vector_position_vectorized(FM_CHORDS_W_CARRIER)
 
-
-# for use with roughness calculation
-COMBOS = []
-for i in range(MAX_CHORD_LENGTH):
-    COMBOS.append(np.array(list(itertools.combinations(np.arange(i), 2))))
+def __getattr__(name):
+    if name in FM_TABLES:
+        table, rows, convert = FM_TABLES[name]
+        view = table()[:, rows, :]
+        return view if convert is None else convert(view)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class FMChord(Chord):
@@ -246,10 +268,16 @@ class FMChord(Chord):
             carrier of the fm chord
         modulator : numpy.float64
             modulator of the fm chord
+        sidebands : int
+            the number of sidebands of the fm chord, MAX_SIDEBANDS if not 
+            specified
 
 
     Methods
     -------
+        table_indices(self)
+            returns the carrier and modulator indices in the FM lookup tables
+
         sum_tones(self)
             returns all sum tones associated with modulator and carrier
 
@@ -258,7 +286,7 @@ class FMChord(Chord):
         
 
     """
-    def __init__(self, notes, carrier, modulator, duration=1):
+    def __init__(self, notes, carrier, modulator, duration=1, sidebands=None):
         """
         Contructs FM Chord
 
@@ -271,18 +299,21 @@ class FMChord(Chord):
             carrier : numpy.float64
                 carrier of the fm chord - must be 
             modulator : numpy.float64
+            sidebands : int
+                the number of sidebands, uses MAX_SIDEBANDS if not specified
 
         """
         super().__init__(notes, duration)
         self.carrier = carrier if carrier >= LOW else LOW if carrier <= HIGH else HIGH
         self.modulator = modulator if modulator >= LOW else LOW if modulator <= HIGH else HIGH 
+        self.sidebands = sideband_count(sidebands)
 
 
     def __str__(self):
         return f"{self.notes} carrier:{self.carrier} modulator:{self.modulator} dur:{self.duration}"
 
-    def sum_tones(self):
-        """ Returns all sum tones from carrier and modulator"""
+    def table_indices(self):
+        """Returns the carrier and modulator indices in the FM lookup tables"""
         indicies = find_note_vector_position_vectorized(np.array([self.carrier, self.modulator]))
         if np.isclose(self.carrier, LOW):
             indicies[0] = 0
@@ -292,34 +323,23 @@ class FMChord(Chord):
             indicies[0] = -1
         if np.isclose(self.modulator, HIGH):
             indicies[1] = -1
-        return FM_CHORDS[indicies[0],:MAX_SIDEBANDS,indicies[1]]
+        return indicies
+
+    def sum_tones(self):
+        """ Returns all sum tones from carrier and modulator"""
+        indicies = self.table_indices()
+        return fm_spectra()[indicies[0], FM_SUM_ROWS, indicies[1]][:self.sidebands]
 
 
     def diff_tones(self):
         """ Returns all difference tones from carrier and modulator"""
-        indicies = find_note_vector_position_vectorized(np.array([self.carrier, self.modulator]))
-        if np.isclose(self.carrier, LOW):
-            indicies[0] = 0
-        if np.isclose(self.modulator, LOW):
-            indicies[1] = 0
-        if np.isclose(self.carrier, HIGH):
-            indicies[0] = -1
-        if np.isclose(self.modulator, HIGH):
-            indicies[1] = -1
-        return FM_CHORDS[indicies[0],MAX_SIDEBANDS:,indicies[1]]
+        indicies = self.table_indices()
+        return fm_spectra()[indicies[0], FM_DIFF_ROWS, indicies[1]][:self.sidebands]
 
     def fm_tones(self):
         """Returns all sum and difference tones from carrier and modulator"""
-        indicies = find_note_vector_position_vectorized(np.array([self.carrier, self.modulator]))
-        if np.isclose(self.carrier, LOW):
-            indicies[0] = 0
-        if np.isclose(self.modulator, LOW):
-            indicies[1] = 0
-        if np.isclose(self.carrier, HIGH):
-            indicies[0] = -1
-        if np.isclose(self.modulator, HIGH):
-            indicies[1] = -1
-        return FM_CHORDS[indicies[0], :, indicies[1]]
+        indicies = self.table_indices()
+        return fm_spectra()[indicies[0], fm_tone_rows(self.sidebands), indicies[1]]
 
 
     def chord_sum_tones(self,return_sb=False):
@@ -329,7 +349,7 @@ class FMChord(Chord):
         """
         note_positions = find_note_vector_position_vectorized(self.notes)
         sum_tone_positions = find_note_vector_position_vectorized(self.sum_tones())
-        tones, _, sb =  np.intersect1d(note_positions, sum_tone_positions, return_indices=True)
+        tones, sb = common_tones(note_positions, sum_tone_positions)
         if return_sb:
             return sb + 1
         return NOTE_VECTOR[tones]
@@ -342,7 +362,7 @@ class FMChord(Chord):
         note_positions = find_note_vector_position_vectorized(self.notes)
         diff_tone_positions = find_note_vector_position_vectorized(self.diff_tones())
         # return np.intersect1d(self.notes, self.sum_tones())
-        tones, _, sb =  np.intersect1d(note_positions, diff_tone_positions, return_indices=True)
+        tones, sb = common_tones(note_positions, diff_tone_positions)
         if return_sb:
             return sb + 1
         return NOTE_VECTOR[tones]
@@ -355,16 +375,54 @@ class FMChord(Chord):
         """Returns difference tones from carrier and modulator not in the chord notes"""
         return np.setdiff1d(self.chord_diff_tones(), self.diff_tones())
 
-    def roughness(self, only_notes=False):
+    def roughness(self, only_notes=False, partials=None, rolloff=1.0, 
+        bandwidths=4.0):
         """
         Returns roughness of the entire FM chord (Vassilakis 2001,2005)
 
         Set `only_notes` to True and only chord notes are calculated for roughness
+        Set `partials` to treat every tone as a harmonic tone with that many 
+        partials, see `pygliss.roughness.spectral_roughness`
         """
+        if partials:
+            tones = self.notes if only_notes else self.fm_tones()
+            return spectral_roughness(tones, partials, rolloff, bandwidths)
         if only_notes:
             return calc_roughness(self.notes)
-        return calc_roughness(self.fm_tones())
+        indicies = self.table_indices()
+        return fm_roughness(self.sidebands)[indicies[0], indicies[1]]
+
+
+
+def common_tones(note_steps, tone_steps):
+    """
+    Returns the steps shared by two step arrays with a bitset intersection
+
+    Gives the same tones and indices as `np.intersect1d(note_steps, 
+    tone_steps, return_indices=True)`, out of range steps are never shared
+
+    Parameters
+    ----------
+        note_steps : numpy.ndarray[numpy.int64]
+            steps of the chord notes
+        tone_steps : numpy.ndarray[numpy.int64]
+            steps of the tones, e.g. sum tones or partials
 
+    Returns
+    -------
+        tones : numpy.ndarray[numpy.int64]
+            the sorted shared steps
+        first : numpy.ndarray[numpy.int64]
+            the index of the first occurrence of each shared step in 
+            `tone_steps`
+    """
+    shared = ChordBitset.from_steps(note_steps) & ChordBitset.from_steps(tone_steps)
+    tones = shared.steps()
+    tones = tones[tones > 0]
+    if len(tones) == 0:
+        return tones, tones
+    first = np.argmax(np.asarray(tone_steps) == tones[:, np.newaxis], axis=1)
+    return tones, first
 
 
 def get_chord_distance(chord1_steps, chord2_steps, doublecount=True):
@@ -373,7 +431,9 @@ def get_chord_distance(chord1_steps, chord2_steps, doublecount=True):
     note positions. It could also be used for arrays of frequencies but this 
     wouldn't really give chordal distance.
 
-    Notes can be double counted, for every note, the closest is found
+    Notes can be double counted, for every note, the closest is found. Set 
+    `doublecount` = False to map every note of the smaller chord to a 
+    distinct note of the larger chord instead, with the least total distance
 
     Parameters
     ----------
@@ -381,6 +441,9 @@ def get_chord_distance(chord1_steps, chord2_steps, doublecount=True):
             chord 1 input
         chord2 : numpy.ndarray[numpy.int64] 
             chord 2 input
+        doublecount : bool
+            whether notes of the larger chord can be the closest note of 
+            several notes
 
     Returns
     -------
@@ -388,8 +451,12 @@ def get_chord_distance(chord1_steps, chord2_steps, doublecount=True):
             The stepwise distance between two chords
     """
     if not doublecount:
-        # TODO
-        pass
+        smaller, larger = chord1_steps, chord2_steps
+        if len(chord1_steps) > len(chord2_steps):
+            smaller, larger = chord2_steps, chord1_steps
+        smaller = np.asarray(smaller, dtype=np.int64)[np.newaxis]
+        larger = np.asarray(larger, dtype=np.int64)[np.newaxis]
+        return assignment_distances(smaller, larger)[0]
 
     smaller, larger, dist = chord1_steps, chord2_steps, 0
     if len(chord1_steps) > len(chord2_steps):
@@ -401,8 +468,263 @@ def get_chord_distance(chord1_steps, chord2_steps, doublecount=True):
     return dist
 
 
+def get_chord_distances(chord_steps, candidate_steps, doublecount=True):
+    """
+    Returns `get_chord_distance` between a chord and every row of 
+    `candidate_steps` in one vectorized pass
+
+    Parameters
+    ----------
+        chord_steps : numpy.ndarray[numpy.int64]
+            chord input
+        candidate_steps : 2D numpy.ndarray[numpy.int64] 
+            one candidate chord per row
+        doublecount : bool
+            see `get_chord_distance`
+
+    Returns
+    -------
+        dists : numpy.ndarray[numpy.int64]
+            The stepwise distance between the chord and each candidate
+    """
+    chord_steps = np.asarray(chord_steps, dtype=np.int64)
+    candidate_steps = np.asarray(candidate_steps, dtype=np.int64)
+    if not doublecount:
+        chords = np.broadcast_to(chord_steps, (len(candidate_steps), len(chord_steps)))
+        if len(chord_steps) > candidate_steps.shape[1]:
+            return assignment_distances(candidate_steps, chords)
+        return assignment_distances(chords, candidate_steps)
+    if len(chord_steps) > candidate_steps.shape[1]:
+        diff = candidate_steps[:, :, np.newaxis] - chord_steps
+    else:
+        diff = candidate_steps[:, np.newaxis, :] - chord_steps[:, np.newaxis]
+    return np.abs(diff).min(axis=2).sum(axis=1)
+
+
+def assignment_distances(smaller, larger, smaller_lengths=None, 
+    larger_lengths=None):
+    """
+    Returns the least total distance of a one to one assignment of the 
+    steps of every row of `smaller` to distinct steps of the same row of 
+    `larger`
+
+    For sets of numbers the best assignment never crosses: the i-th lowest 
+    note of the smaller chord goes to a note above the one of the (i-1)-th. 
+    A dynamic program over the sorted steps finds it in O(n * m) per row, 
+    running over the notes of the smaller chords and vectorized over the 
+    rows and the notes of the larger chords.
+
+    Parameters
+    ----------
+        smaller : 2D numpy.ndarray[numpy.int64]
+            one chord per row, padded
+        larger : 2D numpy.ndarray[numpy.int64]
+            one chord per row, padded, with at least as many notes as the 
+            same row of `smaller`
+        smaller_lengths, larger_lengths : numpy.ndarray[numpy.int64]
+            the number of steps of each row, every step of a row is used if
+            not specified
 
-def nearest_ot_chord(chord_freq, m, tiebreak=None):
+    Returns
+    -------
+        dists : numpy.ndarray[numpy.int64]
+            the assignment distance of every row
+    """
+    smaller, smaller_lengths = padded_steps(smaller, smaller_lengths)
+    larger, larger_lengths = padded_steps(larger, larger_lengths)
+    n_rows, n_smaller = smaller.shape
+    smaller_valid = np.arange(n_smaller) < smaller_lengths[:, np.newaxis]
+    # padding of the smaller chords is free anywhere, the larger chords get 
+    # enough free slots at their end to hold it
+    larger = np.concatenate([larger, np.zeros((n_rows, n_smaller), dtype=np.int64)], axis=1)
+    larger_valid = np.arange(larger.shape[1]) < larger_lengths[:, np.newaxis]
+
+    # dists[:, j] is the best assignment of the notes so far to the first j 
+    # notes of the larger chord
+    far = 2 ** 40
+    dists = np.zeros((n_rows, larger.shape[1] + 1), dtype=np.int64)
+    for i in range(n_smaller):
+        cost = np.abs(larger - smaller[:, i, np.newaxis])
+        cost = np.where(larger_valid, cost, far)
+        cost = np.where(smaller_valid[:, i, np.newaxis], cost, 0)
+        dists[:, 1:] = np.minimum(np.minimum.accumulate(dists[:, :-1] + cost, axis=1), far)
+        dists[:, :i + 1] = far
+    return dists[:, -1]
+
+
+def get_chord_distance_matrix(chords1, chords2, lengths1=None, lengths2=None,
+    max_bytes=DEFAULT_MAX_BYTES, doublecount=True):
+    """
+    Returns `get_chord_distance` between every chord of `chords1` and every 
+    chord of `chords2`
+
+    The nearest note of the larger chord is found with `np.searchsorted` on 
+    its sorted steps, O(n log m) per chord pair, for all pairs of a block at
+    once. Blocks of chord pairs keep their temporary arrays under 
+    `max_bytes`. The smaller chord is chosen as in `get_chord_distance`, so 
+    notes are double counted the same way. With `doublecount` = False every 
+    pair is scored with `assignment_distances` instead.
+
+    Parameters
+    ----------
+        chords1, chords2 : list of pygliss.Chord, list of 
+            numpy.ndarray[numpy.int64] or 2D numpy.ndarray[numpy.int64]
+            the chords as Chord objects, step arrays or a padded matrix of 
+            steps with one chord per row
+        lengths1, lengths2 : numpy.ndarray[numpy.int64]
+            the number of steps of each row of a padded matrix, every step 
+            of a row is used if not specified
+        max_bytes : int
+            memory budget for the temporary arrays of a block of chord pairs
+        doublecount : bool
+            see `get_chord_distance`
+
+    Returns
+    -------
+        dists : 2D numpy.ndarray[numpy.int64]
+            `dists[i, j]` is the stepwise distance between `chords1[i]` and 
+            `chords2[j]`
+    """
+    steps1, lengths1 = padded_steps(chords1, lengths1)
+    steps2, lengths2 = padded_steps(chords2, lengths2)
+    if not doublecount:
+        return _assignment_distance_matrix(steps1, lengths1, steps2, lengths2, 
+            max_bytes)
+    valid1 = np.arange(steps1.shape[1]) < lengths1[:, np.newaxis]
+    valid2 = np.arange(steps2.shape[1]) < lengths2[:, np.newaxis]
+    if valid1.any() or valid2.any():
+        low = min(steps1[valid1].min(initial=0), steps2[valid2].min(initial=0))
+        high = max(steps1[valid1].max(initial=0), steps2[valid2].max(initial=0))
+        # steps relative to the lowest step, so rows can be offset by `span`
+        steps1, steps2, span = steps1 - low, steps2 - low, high - low + 1
+    else:
+        span = 1
+
+    dists = np.zeros((len(steps1), len(steps2)), dtype=np.int64)
+    width = max(steps1.shape[1], steps2.shape[1], 1)
+    block2 = max(1, min(len(steps2), max_bytes // (2 * 8 * 8 * width)))
+    block1 = max(1, max_bytes // (2 * 8 * 8 * width * block2))
+    for start2 in range(0, len(steps2), block2):
+        rows2 = slice(start2, start2 + block2)
+        for start1 in range(0, len(steps1), block1):
+            rows1 = slice(start1, start1 + block1)
+            forward = _directed_distances(steps1[rows1], lengths1[rows1], 
+                steps2[rows2], lengths2[rows2], span)
+            backward = _directed_distances(steps2[rows2], lengths2[rows2], 
+                steps1[rows1], lengths1[rows1], span).T
+            smaller2 = lengths1[rows1, np.newaxis] > lengths2[np.newaxis, rows2]
+            dists[rows1, rows2] = np.where(smaller2, backward, forward)
+    return dists
+
+
+def _assignment_distance_matrix(steps1, lengths1, steps2, lengths2, max_bytes):
+    """`get_chord_distance_matrix` with `doublecount` = False"""
+    width = max(steps1.shape[1], steps2.shape[1])
+    steps1 = np.pad(steps1, ((0, 0), (0, width - steps1.shape[1])))
+    steps2 = np.pad(steps2, ((0, 0), (0, width - steps2.shape[1])))
+    dists = np.zeros((len(steps1), len(steps2)), dtype=np.int64)
+    block = max(1, max_bytes // (8 * 8 * 3 * (width + 1)))
+    rows, cols = np.divmod(np.arange(dists.size), len(steps2) or 1)
+    for start in range(0, dists.size, block):
+        row, col = rows[start:start + block], cols[start:start + block]
+        swap = (lengths1[row] > lengths2[col])[:, np.newaxis]
+        smaller = np.where(swap, steps2[col], steps1[row])
+        larger = np.where(swap, steps1[row], steps2[col])
+        dists[row, col] = assignment_distances(smaller, larger, 
+            np.minimum(lengths1[row], lengths2[col]), 
+            np.maximum(lengths1[row], lengths2[col]))
+    return dists
+
+
+def padded_steps(chords, lengths=None):
+    """
+    Normalize a collection of chords to a padded matrix of steps
+
+    This is the common input format of the functions working on chord 
+    collections, e.g. `get_chord_distance_matrix` and 
+    `pygliss.chord_index.ChordIndex`.
+
+    Parameters
+    ----------
+        chords : list of pygliss.Chord, list of numpy.ndarray[numpy.int64] 
+            or 2D numpy.ndarray[numpy.int64]
+            the chords as Chord objects, step arrays or a padded matrix of 
+            steps with one chord per row
+        lengths : numpy.ndarray[numpy.int64]
+            the number of steps of each row of a padded matrix, every step 
+            of a row is used if not specified
+
+    Returns
+    -------
+        steps : 2D numpy.ndarray[numpy.int64]
+            the steps of every chord sorted in its row, padded at the end 
+            with 0
+        lengths : numpy.ndarray[numpy.int64]
+            the number of steps of every chord
+    """
+    if isinstance(chords, (list, tuple)):
+        rows = [np.asarray(getattr(chord, "steps", chord), dtype=np.int64) 
+            for chord in chords]
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        steps = np.zeros((len(rows), lengths.max(initial=0)), dtype=np.int64)
+        for i, row in enumerate(rows):
+            steps[i, :len(row)] = row
+    else:
+        steps = np.asarray(chords, dtype=np.int64)
+        lengths = (np.full(len(steps), steps.shape[1]) if lengths is None 
+            else np.asarray(lengths, dtype=np.int64))
+    valid = np.arange(steps.shape[1]) < lengths[:, np.newaxis]
+    steps = np.sort(np.where(valid, steps, np.iinfo(np.int64).max), axis=1)
+    return np.where(valid, steps, 0), lengths
+
+
+def _directed_distances(queries, query_lengths, targets, target_lengths, span):
+    """
+    Sums, for every pair of a query row and a target row, the distance of 
+    each query step to the nearest step of the target row
+
+    Target rows are laid out one after the other in a single sorted array, 
+    row `j` offset by `j * span`, and every query step is searched in it
+    """
+    n_targets = len(targets)
+    target_valid = np.arange(targets.shape[1]) < target_lengths[:, np.newaxis]
+    offsets = np.arange(n_targets) * span
+    keys = (targets + offsets[:, np.newaxis])[target_valid]
+    if len(keys) == 0:
+        return np.zeros((len(queries), n_targets), dtype=np.int64)
+    ends = np.cumsum(target_lengths)
+    starts = ends - target_lengths
+
+    values = queries[:, np.newaxis, :] + offsets[np.newaxis, :, np.newaxis]
+    pos = np.searchsorted(keys, values)
+    far = np.iinfo(np.int64).max // 4
+    below = np.where(pos - 1 >= starts[:, np.newaxis], 
+        values - keys[np.maximum(pos - 1, 0)], far)
+    above = np.where(pos < ends[:, np.newaxis], 
+        keys[np.minimum(pos, len(keys) - 1)] - values, far)
+    nearest = np.minimum(below, above)
+    in_use = (np.arange(queries.shape[1]) < query_lengths[:, np.newaxis])
+    in_use = in_use[:, np.newaxis, :] & (target_lengths > 0)[:, np.newaxis]
+    return np.where(in_use, nearest, 0).sum(axis=2)
+
+
+def _nearest_step_pairs(chord_steps, offsets, pairs):
+    """
+    Returns the flat (carrier, modulator) pairs of the step index holding a 
+    tone at the minimum stepwise distance of any chord note
+    """
+    present = np.flatnonzero(np.diff(offsets))
+    # slot 0 holds out of range tones, stored with the int16 sentinel
+    present_steps = np.where(present == 0, FM_STEP_SENTINEL, present)
+    search_steps = np.where(chord_steps == -999999, FM_STEP_SENTINEL, chord_steps)
+    diff = np.abs(present_steps - search_steps[:, np.newaxis])
+    slots = present[(diff == diff.min(axis=1)[:, np.newaxis]).any(axis=0)]
+    return np.unique(np.concatenate(
+        [pairs[offsets[slot]:offsets[slot + 1]] for slot in slots]))
+
+
+
+def nearest_ot_chord(chord_freq, m, tiebreak=None, doublecount=False):
     """
     A vectorized implementation of finding the nearest overtone chord extended 
     from Terhardt's subCoincidence algorithm for calculating virtual pitch. See
@@ -415,122 +737,180 @@ def nearest_ot_chord(chord_freq, m, tiebreak=None):
         m : int
             the number of subharmonics considered
         tiebreak : str
-            determines the behavior of the tiebreak. set tiebreak to `highest` 
-            and the subhamonic is derived from the highest note in the chord is 
-            chosen
+            determines the behavior of the tiebreak. by default the tied 
+            overtone chord with the highest fundamental is chosen, set 
+            tiebreak to `lowest` to choose the lowest fundamental instead
+        doublecount : bool
+            scores the overtone chords with the one to one note assignment 
+            by default, set to True to match each note of the chord to its 
+            closest overtone like `get_chord_distance`
 
     Returns
     -------
         chord frequencies of nearest overtone : numpy.ndarray[numpy.float64]
             the nearest overtone chord frequencies as a numpy array
     """
-    chord_freq = chord_freq[chord_freq >= NOTE_VECTOR[0]]
-    chord_freq = np.sort(chord_freq)
-    chord_steps = find_note_vector_position_vectorized(chord_freq)
-    len_notes = len(chord_freq)
-    
-    # generate all possible overtone chords
-    all_chord_sets = np.ones((len_notes, m, len_notes))
-    for i in range(len_notes):
-        # print(f"chord_freq[i]:{i}:{chord_freq[i]}")
-        subharmonics = chord_freq[i] * (1 / np.arange(1, m + 1))
-        # filter values lower than human hearing
-        # subharmonics = np.where(subharmonics >= LOW, subharmonics, -1)
-
-        # TEMP FIX - because the low value is zeroed out in find_note_vector_position_vectorized
-        # we have to use 1 value above the lowest to avoid the index out of range issue
-        subharmonics = np.where(subharmonics >= NOTE_VECTOR[1], subharmonics, np.inf)
-        # # replace +inf values with min hearable value
-        # # TODO - remove duplicates 
-        subharmonics = np.where(subharmonics == np.inf, np.min(subharmonics), subharmonics)
-        # adjust subharmonics for equal temperament note values
-        subharmonics = NOTE_VECTOR[find_note_vector_position_vectorized(subharmonics)]
-        harmonics = np.rint(chord_freq / subharmonics[:,np.newaxis]) # should this be chord_freq[i] ?????
-        chords = harmonics * subharmonics[:, np.newaxis]
-        all_chord_sets[i] = chords
-        
-    # convert frequencies to nearest step of temperment set in `DIVISIONS`
-    all_chord_steps = find_note_vector_position_vectorized(all_chord_sets)
-    
-    # distance by summing stepwise difference along axis
-    # print("all_chord_steps", all_chord_steps)
-    # print()
-    # print("chord_steps", chord_steps)
-
-    diff_from_target_chord = np.sum(np.abs(all_chord_steps - chord_steps), axis=2)
-
-    # choose subharmonic chord with highest fundamental
-    # print("diff_from_target_chord", diff_from_target_chord, diff_from_target_chord.min())
-    min_diff = np.where(diff_from_target_chord == diff_from_target_chord.min())
-    # print(f"\nmin_diff", min_diff)
-    # row_idx, chord_idx = min_diff[0][-1], min_diff[1][-1] # original calc
-    # print(f"row_idx:{row_idx} chord_idx:{chord_idx}")
-    # row_idx, chord_idx = min_diff[0][0], min_diff[1][0] # seems better but not 100% right
-    # print(f"row_idx:{row_idx} chord_idx:{chord_idx}")
-    # if tiebreak == "lowest":
-    #     # row_idx, chord_idx = min_diff[0][0], min_diff[1][0]
-    #     row_idx, chord_idx = min_diff[0][-1], min_diff[1][-1]
-
-    ##do iterative version for sanity check
-    fundamental = float("inf") if tiebreak == "lowest" else 0
-    row_idx, chord_idx = 0, 0
-    for i in range(len(min_diff[0])):
-        temp_row_idx, temp_chord_idx = min_diff[0][i], min_diff[1][i]
-        temp_fund = chord_freq[temp_row_idx] * (1 / (temp_chord_idx + 1))
-        # print(f"i:{i} temp_fund:{temp_fund}")
-        if temp_fund > fundamental and temp_fund >= LOW and tiebreak is None:
-            fundamental = temp_fund
-            row_idx, chord_idx = temp_row_idx, temp_chord_idx
-        elif tiebreak == "lowest" and temp_fund < fundamental and temp_fund >= LOW:
-            fundamental = temp_fund
-            row_idx, chord_idx = temp_row_idx, temp_chord_idx
-
-    ot_notes = all_chord_sets[row_idx, chord_idx]
-    # fundamental = chord_freq[row_idx] * (1 / (chord_idx + 1)) # original solution
-    # print(f"final fund:{fundamental}")
-    
-    return OvertoneChord(ot_notes, fundamental)
-
-
-
-
-def calc_roughness(chord_freq):
+    chord_freq = np.asarray(chord_freq, dtype=np.float64)
+    chord_freq = np.sort(chord_freq[chord_freq >= NOTE_VECTOR[0]])
+    # overtone chords are built from the frequencies, not only their steps
+    key = result_key(chord_freq, int(m), tiebreak, bool(doublecount))
+    found = OT_RESULTS.get(key)
+    if found is None:
+        ot_notes, fundamentals = _nearest_ot_chord_sets(chord_freq[np.newaxis], 
+            np.full(1, len(chord_freq)), m, tiebreak, doublecount)
+        found = (ot_notes[0], fundamentals[0])
+        OT_RESULTS.put(key, found)
+    return OvertoneChord(found[0].copy(), found[1][()])
+
+
+def nearest_ot_chords(chords, m, lengths=None, tiebreak=None, 
+    doublecount=False, max_bytes=DEFAULT_MAX_BYTES):
     """
-    Calculates the roughness of a chord frequencies from Vassilakis 2001,2005
-    Ampltitude is set constant at 1
-
-    http://www.acousticslab.org/learnmoresra/moremodel.html
+    Find the nearest overtone chord for every chord of a collection
 
+    Gives the same chords as calling `nearest_ot_chord` on each chord. The 
+    overtone chords of all rows are built and scored together in chunks, each 
+    chunk keeps its temporary arrays under `max_bytes`.
 
     Parameters
     ----------
-        chord_freq : numpy.ndarray[numpy.float64]
-            the frequencies of the input chord
+        chords : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+            the chords to analyse, one chord per row
+        m : int
+            the number of subharmonics considered
+        lengths : numpy.ndarray[numpy.int64]
+            the number of notes of each row when `chords` is padded, every 
+            note of a row is used if not specified
+        tiebreak : str
+            see `nearest_ot_chord`
+        doublecount : bool
+            see `nearest_ot_chord`
+        max_bytes : int
+            memory budget for the temporary arrays of the overtone chords
 
     Returns
     -------
-        roughness : numpy.float64
-            roughness as defined by Vassilakis
-         
+        ot_chords : list of pygliss.OvertoneChord
+            the nearest overtone chord of every row, None for rows without 
+            any note
     """
-    c = COMBOS[len(chord_freq)]
-    freq_pairs = chord_freq[c]
-    amp_arr = np.ones((freq_pairs.shape))
-    
-    A_min, A_max = np.min(amp_arr, axis=1), np.max(amp_arr, axis=1)
-    F_min, F_max = np.min(freq_pairs, axis=1), np.max(freq_pairs, axis=1)
-    X = A_min * A_max
-    Y = 2 * A_min / (A_min + A_max)
-    b1, b2 = 3.5, 5.75
-    s1, s2 = 0.0207, 18.96
-    s = 0.24 / (s1 * F_min + s2)
-    Z = np.exp(-1 * b1 * s *(F_max - F_min)) - np.exp(-b2 * s * (F_max - F_min))    
-    R = np.power(X, 0.1) * 0.5 * np.power(Y, 3.11) * Z
-    
-    return np.sum(R)
+    chords, lengths, mask = _padded_chords(chords, lengths)
+
+    # drop notes below the note vector and push them to the end of the row
+    mask &= chords >= NOTE_VECTOR[0]
+    chords = np.sort(np.where(mask, chords, np.inf), axis=1)
+    lengths = mask.sum(axis=1)
+    width = lengths.max(initial=0)
+    chords = chords[:, :width]
+
+    ot_chords = [None] * len(chords)
+    rows = np.flatnonzero(lengths)
+    per_row = 4 * 8 * m * width ** 2 * (width if doublecount else 1)
+    chunk = max(1, max_bytes // (per_row or 1))
+    for start in range(0, len(rows), chunk):
+        idx = rows[start:start + chunk]
+        ot_notes, fundamentals = _nearest_ot_chord_sets(chords[idx], 
+            lengths[idx], m, tiebreak, doublecount)
+        for i, row in enumerate(idx):
+            ot_chords[row] = OvertoneChord(ot_notes[i, :lengths[row]], 
+                fundamentals[i])
+    return ot_chords
+
+
+def _padded_chords(chords, lengths=None):
+    """
+    Normalize a batch of chords to a padded matrix, its row lengths and the 
+    mask of the notes in use
+    """
+    chords = np.asarray(getattr(chords, "chords", chords), dtype=np.float64)
+    if lengths is None:
+        lengths = np.full(len(chords), chords.shape[1])
+    lengths = np.asarray(lengths)
+    mask = np.arange(chords.shape[1]) < lengths[:, np.newaxis]
+    return chords, lengths, mask
 
 
-def nearest_fm_chord(chord_freq, sidebands=None):
+def _nearest_ot_chord_sets(chord_freq, lengths, m, tiebreak=None, 
+    doublecount=False):
+    """
+    Build and score every overtone chord of a batch of sorted chords, padded 
+    at the end of each row, in a single (chord x note x subharmonic x note) 
+    broadcast
+
+    Returns the notes of the chosen overtone chord and its fundamental for 
+    every row, following the tiebreak and scoring rules of `nearest_ot_chord`
+    """
+    n_chords, len_notes = chord_freq.shape
+    mask = np.arange(len_notes) < lengths[:, np.newaxis]
+    # padding gets a valid frequency and is masked out of the scores
+    chord_freq = np.where(mask, chord_freq, NOTE_VECTOR[1])
+    chord_steps = find_note_vector_position_vectorized(chord_freq)
+
+    # generate all possible overtone chords
+    subharmonics = chord_freq[:, :, np.newaxis] * (1 / np.arange(1, m + 1))
+    # TEMP FIX - because the low value is zeroed out in find_note_vector_position_vectorized
+    # we have to use 1 value above the lowest to avoid the index out of range issue
+    subharmonics = np.where(subharmonics >= NOTE_VECTOR[1], subharmonics, np.inf)
+    # replace +inf values with min hearable value of the same note
+    subharmonics = np.where(subharmonics == np.inf, 
+        subharmonics.min(axis=2, keepdims=True), subharmonics)
+    # adjust subharmonics for equal temperament note values
+    subharmonic_steps = find_note_vector_position_vectorized(subharmonics)
+    subharmonics = NOTE_VECTOR[subharmonic_steps][:, :, :, np.newaxis]
+    harmonics = np.rint(chord_freq[:, np.newaxis, np.newaxis, :] / subharmonics)
+
+    # distance by summing stepwise difference along axis, the steps of the 
+    # overtone chords come from the harmonic series table
+    all_chord_steps = lookup_harmonic_steps(
+        subharmonic_steps[:, :, :, np.newaxis], harmonics.astype(np.int64))
+    if doublecount:
+        # every chord note is matched to its closest overtone, like 
+        # get_chord_distance
+        diff = np.abs(all_chord_steps[..., np.newaxis] - 
+            chord_steps[:, np.newaxis, np.newaxis, np.newaxis, :])
+        diff = np.where(mask[:, np.newaxis, np.newaxis, :, np.newaxis], 
+            diff, np.iinfo(np.int64).max).min(axis=3)
+    else:
+        # both chords are sorted and the same size, so matching the notes 
+        # in order is the optimal one to one assignment
+        diff = np.abs(all_chord_steps - 
+            chord_steps[:, np.newaxis, np.newaxis, :])
+    diff = np.where(mask[:, np.newaxis, np.newaxis, :], diff, 0).sum(axis=3)
+    diff = np.where(mask[:, :, np.newaxis], diff, np.iinfo(np.int64).max)
+
+    # tied chords whose fundamental is hearable, the first tie in row-major 
+    # order wins among equal fundamentals
+    fundamentals = chord_freq[:, :, np.newaxis] * (1 / np.arange(1, m + 1))
+    eligible = (diff == diff.min(axis=(1, 2), keepdims=True)) & \
+        (fundamentals >= LOW)
+    eligible = eligible.reshape(n_chords, -1)
+    fundamentals = fundamentals.reshape(n_chords, -1)
+    found = eligible.any(axis=1)
+    if tiebreak is None:
+        best = np.argmax(np.where(eligible, fundamentals, -np.inf), axis=1)
+        default = 0
+    elif tiebreak == "lowest":
+        best = np.argmin(np.where(eligible, fundamentals, np.inf), axis=1)
+        default = float("inf")
+    else:
+        found = np.zeros(n_chords, dtype=bool)
+        best = np.zeros(n_chords, dtype=np.int64)
+        default = 0
+    best = np.where(found, best, 0)
+    fundamentals = np.where(found, fundamentals[np.arange(n_chords), best], 
+        default)
+
+    rows = np.arange(n_chords)
+    ot_notes = (harmonics[rows, best // m, best % m] * 
+        subharmonics[rows, best // m, best % m])
+    return ot_notes, fundamentals
+
+
+
+
+
+
+def nearest_fm_chord(chord_freq, sidebands=None, doublecount=True):
     """
     Find the nearest stepwise FM chords to the input chord 
 
@@ -541,6 +921,9 @@ def nearest_fm_chord(chord_freq, sidebands=None):
         sidebands : int
             the number of sidebands considered, uses MAX_SIDEBANDS if not
             specified
+        doublecount : bool
+            set to False to score FM chords with one to one note 
+            assignments, see `get_chord_distance`
 
     Returns
     -------
@@ -553,95 +936,437 @@ def nearest_fm_chord(chord_freq, sidebands=None):
                 the resultant FM chord
 
     """
-    fm_chords_steps_w_carrier = None
-    if not sidebands:
-        fm_chords_steps_w_carrier = FM_CHORDS_W_CARRIER_STEPS
-    elif sidebands < MAX_SIDEBANDS:
-        sum_tones = FM_CHORDS_W_CARRIER_STEPS[:,:sidebands,:]
-        diff_tones = FM_CHORDS_W_CARRIER_STEPS[:,sidebands:-1,:]
-        carrier = FM_CHORDS_W_CARRIER_STEPS[:,MAX_SIDEBANDS * 2:,:]
-        temp = np.hstack((sum_tones, diff_tones))
-        fm_chords_steps_w_carrier = np.hstack((temp, carrier))
-
     chord_steps = np.sort(find_note_vector_position_vectorized(chord_freq))
-    min_steps, candidates = float("+inf"), set()
-    solutions = []
-    
-    #find minimium stepwise distance of each chord note to all FM CHORDS
-    for i in range(len(chord_steps)):
-        diff = np.abs(fm_chords_steps_w_carrier - chord_steps[i])
-        min_diff = np.where(diff == diff.min())
-        #add candidate chords to set
-        for idx in range(len(min_diff[0])):
-            candidates.add((min_diff[0][idx], min_diff[2][idx]))
+    if len(chord_steps) == 0:
+        return []
+
+    # the search only depends on the steps, the solutions are rebuilt around 
+    # the frequencies of this chord
+    carriers, modulators, min_steps = _cached_fm_pairs(chord_steps, sidebands, 
+        doublecount)
+    return _fm_solutions(chord_freq, carriers, modulators, min_steps, sidebands)
+
+
+def _cached_fm_pairs(chord_steps, sidebands, doublecount, 
+    max_bytes=DEFAULT_MAX_BYTES):
+    """`_nearest_fm_pairs` through the `FM_RESULTS` cache"""
+    key = result_key(chord_steps, sideband_count(sidebands), bool(doublecount))
+    found = FM_RESULTS.get(key)
+    if found is None:
+        found = _nearest_fm_pairs(chord_steps, sidebands, doublecount, 
+            max_bytes)
+        FM_RESULTS.put(key, found)
+    return found
+
+
+def _nearest_fm_pairs(chord_steps, sidebands, doublecount, 
+    max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Returns the carriers and modulators of the nearest FM chords of sorted 
+    chord steps and their distance, see `nearest_fm_chord`. The FM chords are
+    scored in chunks that keep their temporary arrays under `max_bytes`
+    """
+    fm_steps = fm_sideband_steps(sidebands)
+    offsets, pairs = fm_sideband_step_index(sidebands)
+    if not doublecount:
+        return _nearest_fm_assignments(chord_steps, fm_steps, max_bytes)
+
+    # FM chords holding every chord note are exact matches
+    bitsets = fm_sideband_bitsets(sidebands)
+    chord_bitset = ChordBitset.from_steps(chord_steps)
+    chunk = max(1, max_bytes // (3 * bitsets[0].nbytes))
+    exact = np.concatenate([ChordBitset(bitsets[start:start + chunk]).contains(
+        chord_bitset) for start in range(0, len(bitsets), chunk)])
+    if exact.any():
+        carriers, modulators = np.nonzero(exact)
+        return carriers, modulators, 0
+
+    #find the FM CHORDS closest to each chord note with the step index
+    candidates = _nearest_step_pairs(chord_steps, offsets, pairs)
+    carriers = candidates // len(NOTE_VECTOR)
+    modulators = candidates % len(NOTE_VECTOR)
     
     #find minimium stepwise distance of each candidate chord to original chord
-    for candidate in candidates:
-        fm_chord = fm_chords_steps_w_carrier[candidate[0],:,candidate[1]]
-        dist = get_chord_distance(chord_steps, fm_chord)
-        if dist < min_steps:
-            min_steps = dist
-            solutions = [{
-                "min_steps":min_steps,
-                "roughness":calc_roughness(FM_CHORDS[candidate[0],:, candidate[1]]),
-                "fm_chord":FMChord(chord_freq, NOTE_VECTOR[candidate[0]], 
-                    NOTE_VECTOR[candidate[1]])
-            }]
-
-        elif dist == min_steps:
-            solutions.append({
-                "min_steps":min_steps,
-                "roughness":calc_roughness(FM_CHORDS[candidate[0],:, candidate[1]]),
-                "fm_chord":FMChord(chord_freq, NOTE_VECTOR[candidate[0]], 
-                    NOTE_VECTOR[candidate[1]])
-            })
+    chunk = max(1, max_bytes // (4 * 8 * fm_steps.shape[1] * len(chord_steps)))
+    parts = [slice(start, start + chunk) 
+        for start in range(0, len(candidates), chunk)]
+    dists = np.concatenate([get_chord_distances(chord_steps, expand_steps(
+        fm_steps[carriers[part], :, modulators[part]])) for part in parts])
+    best = dists == dists.min()
+    return carriers[best], modulators[best], dists.min()
+
+
+def _nearest_fm_assignments(chord_steps, fm_steps, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    `nearest_fm_chord` with one to one note assignments
 
-    return sorted(solutions, key=lambda x: (x['roughness'], x['fm_chord'].carrier, x['fm_chord'].modulator))
+    The double counting distance of an FM chord never exceeds its 
+    assignment distance, so FM chords are scored in order of their double 
+    counting distance until it passes the best assignment distance found
+    """
+    n_modulators = fm_steps.shape[2]
+    candidates = np.arange(fm_steps.shape[0] * n_modulators)
+    chunk = max(1, max_bytes // 
+        (4 * 8 * 8 * (fm_steps.shape[1] + len(chord_steps))))
+    fm_chord_steps = lambda idx: expand_steps(
+        fm_steps[idx // n_modulators, :, idx % n_modulators])
+    lower_bounds = np.concatenate([
+        get_chord_distances(chord_steps, fm_chord_steps(idx)) 
+        for idx in np.array_split(candidates, -(-len(candidates) // chunk))])
+    order = np.argsort(lower_bounds, kind="stable")
+
+    dists = np.full(len(candidates), np.iinfo(np.int64).max)
+    min_steps = np.iinfo(np.int64).max
+    for start in range(0, len(order), chunk):
+        idx = order[start:start + chunk]
+        if lower_bounds[idx[0]] > min_steps:
+            break
+        dists[idx] = get_chord_distances(chord_steps, fm_chord_steps(idx), 
+            doublecount=False)
+        min_steps = min(min_steps, dists[idx].min())
+    best = candidates[dists == min_steps]
+    return best // n_modulators, best % n_modulators, min_steps
+
+
+def nearest_fm_chords(chords, lengths=None, sidebands=None, 
+    max_bytes=DEFAULT_MAX_BYTES, doublecount=True):
+    """
+    Find the nearest stepwise FM chords for every chord of a collection
 
+    Gives the same solutions as calling `nearest_fm_chord` on each chord. 
+    Rows on the same sorted steps share one search, which goes through the 
+    `FM_RESULTS` cache like `nearest_fm_chord`. Every search scores its FM 
+    chords in chunks that keep their temporary arrays under `max_bytes`.
+
+    Parameters
+    ----------
+        chords : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+            the chords to analyse, one chord per row
+        lengths : numpy.ndarray[numpy.int64]
+            the number of notes of each row when `chords` is padded, every 
+            note of a row is used if not specified
+        sidebands : int
+            the number of sidebands considered, uses MAX_SIDEBANDS if not
+            specified
+        max_bytes : int
+            memory budget for the temporary arrays of the distance 
+            calculation
+        doublecount : bool
+            see `nearest_fm_chord`
+
+    Returns
+    -------
+        solutions : list of list of dict
+            the `nearest_fm_chord` solutions of every row
+    """
+    chords, lengths, mask = _padded_chords(chords, lengths)
+
+    # sort the notes of each row, padding is pushed to the end of the row
+    chord_steps = find_note_vector_position_vectorized(chords)
+    chord_steps = np.sort(np.where(mask, chord_steps, np.iinfo(np.int64).max), 
+        axis=1)
+    chord_steps = np.where(mask, chord_steps, 0)
+    keys, inverse = np.unique(np.column_stack([lengths, chord_steps]), axis=0, 
+        return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    found = [_cached_fm_pairs(key[1:1 + key[0]], sidebands, doublecount, 
+        max_bytes) if key[0] else None for key in keys]
+    solutions = []
+    for row, unique in enumerate(inverse):
+        if found[unique] is None:
+            solutions.append([])
+            continue
+        solutions.append(_fm_solutions(chords[row, :lengths[row]], 
+            *found[unique], sidebands))
+    return solutions
+
+
+def _fm_solutions(chord_freq, carriers, modulators, min_steps, sidebands=None,
+    limit=None, max_roughness=None):
+    """
+    Returns the solution dicts of `nearest_fm_chord` for the given pairs 
+    sorted by distance, roughness, carrier and modulator. `min_steps` is the 
+    distance of every pair or a single distance shared by all of them, only 
+    the first `limit` solutions are built when it is set, and only those with
+    a roughness up to `max_roughness`
+    """
+    carriers, modulators = np.asarray(carriers), np.asarray(modulators)
+    min_steps = np.broadcast_to(min_steps, len(carriers))
+    roughness = fm_roughness(sidebands)[carriers, modulators]
+    if max_roughness is not None:
+        keep = roughness <= max_roughness
+        carriers, modulators = carriers[keep], modulators[keep]
+        min_steps, roughness = min_steps[keep], roughness[keep]
+    # NOTE_VECTOR is ascending so pair indices sort like the frequencies
+    order = np.lexsort((modulators, carriers, roughness, min_steps))[:limit]
+
+    solutions = []
+    for idx in order:
+        solutions.append({
+            "min_steps":min_steps[idx],
+            "roughness":roughness[idx],
+            "fm_chord":FMChord(chord_freq, NOTE_VECTOR[carriers[idx]], 
+                NOTE_VECTOR[modulators[idx]], sidebands=sidebands)
+        })
+    return solutions
+
+
+def k_nearest_fm_chords(chord_freq, k=None, max_dist=None, sidebands=None):
+    """
+    Find the `k` nearest FM chords, or every FM chord within `max_dist` steps,
+    of the input chord
+
+    A branch and bound search over the step index. The search radius around 
+    every chord note grows one step at a time and each (carrier, modulator) 
+    pair keeps the distance of its closest tone to every note found so far. 
+    Notes without a tone inside the radius count as radius + 1, a lower bound
+    of the real distance. The search stops as soon as no partly matched pair 
+    can beat the current `k`th best distance, so most pairs are never scored.
+    Chords with more notes than an FM chord, or with out of range notes, are 
+    scored exhaustively.
+
+    Parameters
+    ----------
+        chord_freq : numpy.ndarray[numpy.float64]
+            the frequencies of the input chord
+        k : int
+            the number of FM chords returned
+        max_dist : int
+            the maximum stepwise distance of the returned FM chords
+        sidebands : int
+            the number of sidebands considered, uses MAX_SIDEBANDS if not
+            specified
 
+    Returns
+    -------
+        solutions : list of dict
+            the solutions in the format of `nearest_fm_chord`, sorted by 
+            distance (`min_steps`), roughness, carrier and modulator
+    """
+    if k is None and max_dist is None:
+        raise ValueError("Either `k` or `max_dist` must be specified")
 
-def filter_fm_ot_chords(chords, ot_subharm=12, ot_dist=0, fm_roughness=10):
+    fm_steps = fm_sideband_steps(sidebands)
+    offsets, pairs = fm_sideband_step_index(sidebands)
+    chord_steps = np.sort(find_note_vector_position_vectorized(chord_freq))
+    if len(chord_steps) == 0:
+        return []
+
+    n_pairs = fm_steps.shape[0] * fm_steps.shape[2]
+    threshold = np.inf if max_dist is None else max_dist
+    if len(chord_steps) > fm_steps.shape[1] or np.any(chord_steps == -999999):
+        candidates = np.arange(n_pairs)
+        dists = np.concatenate([get_chord_distances(chord_steps, 
+            expand_steps(fm_steps[chunk // fm_steps.shape[2], :, chunk % fm_steps.shape[2]]))
+            for chunk in np.array_split(candidates, 64)])
+    else:
+        # closest tone of every pair to every note found so far
+        note_dists = np.full((len(chord_steps), n_pairs), np.iinfo(np.int64).max)
+        max_radius = len(offsets) - 1
+        for radius in range(max_radius + 1):
+            for i, step in enumerate(chord_steps):
+                for slot in {step - radius, step + radius}:
+                    if 1 <= slot < len(offsets) - 1:
+                        hits = pairs[offsets[slot]:offsets[slot + 1]]
+                        note_dists[i, hits] = np.minimum(note_dists[i, hits], radius)
+
+            found = note_dists <= radius
+            complete = found.all(axis=0)
+            dists = note_dists.sum(axis=0, where=found)
+            if k is not None and np.count_nonzero(complete) >= k:
+                threshold = min(threshold, np.partition(dists[complete], k - 1)[k - 1])
+            lower_bound = dists + (radius + 1) * np.count_nonzero(~found, axis=0)
+            if not np.any(lower_bound[~complete] <= threshold):
+                break
+        candidates = np.flatnonzero(complete)
+        dists = dists[complete]
+
+    keep = dists <= threshold
+    candidates, dists = candidates[keep], dists[keep]
+    return _fm_solutions(chord_freq, candidates // fm_steps.shape[2], 
+        candidates % fm_steps.shape[2], dists, sidebands, limit=k)
+
+
+def filter_fm_ot_chords(chords, ot_subharm=12, ot_dist=0, fm_roughness=10, 
+    workers=1, chunksize=16):
     """
     Given a list of chord obects, it returns candidates of nearest overtone chord 
     and nearest fm chords based on specified parameters
 
+    With `workers` > 1, or None for one worker per CPU, the chords are sent in 
+    chunks of `chunksize` to a `ProcessPoolExecutor`. The workers attach to 
+    the lookup tables of this process through `SharedTables`, and the 
+    solutions come back in the order of the chords, the same as running in 
+    this process. An exception raised in a worker is raised again here.
+
     Returns dictionary of solutions
 
+    """
+    chords = list(chords)
+    if workers == 1:
+        return _filter_fm_ot_chunk(chords, 0, ot_subharm, ot_dist, 
+            fm_roughness)
+
+    solutions = []
+    with SharedTables() as shared, ProcessPoolExecutor(workers, 
+        initializer=shared.initializer, initargs=shared.initargs) as executor:
+        futures = [executor.submit(_filter_fm_ot_chunk, 
+            chords[start:start + chunksize], start, ot_subharm, ot_dist, 
+            fm_roughness) for start in range(0, len(chords), chunksize)]
+        try:
+            for future in futures:
+                solutions.extend(future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return solutions
+
+
+def _filter_fm_ot_chunk(chords, start, ot_subharm, ot_dist, fm_roughness):
+    """
+    `filter_fm_ot_chords` of a chunk of chords, `start` is the index of the 
+    first chord of the chunk
     """
     solutions = []
     for idx, chord in enumerate(chords):
-        candidate_chords = []
-        fm_solutions = nearest_fm_chord(chord.notes)
-        for sol in fm_solutions:
-            if sol['roughness'] <= fm_roughness:
-                candidate_chords.append({
-                    "type":"fm",
-                    "full_roughness":sol['roughness'],
-                    "roughness":calc_roughness(sol['fm_chord'].notes),
-                    "chord":sol['fm_chord']
-                })          
-        ot = nearest_ot_chord(chord.notes, ot_subharm)
-        cur_ot_dist = ot.distance(chord)
-        if cur_ot_dist <= ot_dist:
-            
-            # include original chord
-            if cur_ot_dist != 0:
-                candidate_chords.append({
-                    "type":f"ot_dist_{cur_ot_dist}_fund_{ot.fundamental_note()}",
-                    "roughness":None,
-                    "chord":chord,
-                    "full_roughness":None
-                })
-            candidate_chords.append({
-                "type":"ot",
-                "roughness":None,
-                "chord":ot,
-                "full_roughness":None
-            })
+        if len(chord.notes) == 0:
+            # silent chords have no candidates
+            continue
+        candidate_chords = _fm_ot_candidates(chord, 
+            nearest_fm_chord(chord.notes), 
+            nearest_ot_chord(chord.notes, ot_subharm), ot_dist, fm_roughness)
         if len(candidate_chords) > 0:
             solutions.append({
                 "candidates":candidate_chords,
-                "idx":idx
+                "idx":start + idx
             })
     return solutions
 
+
+def _fm_ot_candidates(chord, fm_solutions, ot, ot_dist, fm_roughness):
+    """
+    Returns the candidates of `filter_fm_ot_chords` for a chord given its 
+    nearest FM chords and its nearest overtone chord
+    """
+    candidate_chords = []
+    for sol in fm_solutions:
+        if sol['roughness'] <= fm_roughness:
+            candidate_chords.append({
+                "type":"fm",
+                "full_roughness":sol['roughness'],
+                "roughness":calc_roughness(sol['fm_chord'].notes),
+                "chord":sol['fm_chord']
+            })          
+    cur_ot_dist = ot.distance(chord)
+    if cur_ot_dist <= ot_dist:
+        
+        # include original chord
+        if cur_ot_dist != 0:
+            candidate_chords.append({
+                "type":f"ot_dist_{cur_ot_dist}_fund_{ot.fundamental_note()}",
+                "roughness":None,
+                "chord":chord,
+                "full_roughness":None
+            })
+        candidate_chords.append({
+            "type":"ot",
+            "roughness":None,
+            "chord":ot,
+            "full_roughness":None
+        })
+    return candidate_chords
+
+
+def filter_fm_ot_sequence(chords, durations=None, ot_subharm=12, ot_dist=0, 
+    fm_roughness=10):
+    """
+    `filter_fm_ot_chords` over the rows of a chord matrix, analysing every 
+    distinct chord once
+
+    Gives the same solutions as `filter_fm_ot_chords(sequence.to_chord())`. 
+    Rows holding the same notes are found with `np.unique(axis=0)` on the 
+    sorted rows, and the FM search runs once per distinct quantized chord. 
+    Only the FM chords smooth enough to be candidates are built. Overtone 
+    chords of the distinct rows are found together with `nearest_ot_chords`. 
+    The candidates are scattered back to every row that has them, each row 
+    gets its own copies of the candidate chords. Silent rows have no 
+    candidates.
+
+    Parameters
+    ----------
+        chords : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+            the chords, one chord per row, silent voices stored as 0.0
+        durations : numpy.ndarray[numpy.float64]
+            the duration of every row, taken from `chords` if it is a 
+            ChordSequence, 1 otherwise
+        ot_subharm, ot_dist, fm_roughness :
+            see `filter_fm_ot_chords`
+
+    Returns
+    -------
+        solutions : list of dict
+            see `filter_fm_ot_chords`
+    """
+    if durations is None:
+        durations = getattr(chords, "durations", None)
+    matrix = np.asarray(getattr(chords, "chords", chords), dtype=np.float64)
+    matrix = matrix.reshape(len(matrix), -1)
+    if durations is None:
+        durations = np.ones(len(matrix))
+    if len(matrix) == 0:
+        return []
+
+    rows, inverse = np.unique(np.sort(matrix, axis=1), axis=0, 
+        return_inverse=True)
+    inverse = inverse.reshape(-1)
+    with warnings.catch_warnings():
+        # the rows are checked again, with warnings, when they are built
+        warnings.simplefilter("ignore")
+        unique_chords = [Chord(row) for row in rows]
+
+    # distinct quantized chords, keyed by their length and padded steps
+    steps, lengths = padded_steps([np.sort(find_note_vector_position_vectorized(
+        chord.notes)) for chord in unique_chords])
+    keys, fm_inverse = np.unique(np.column_stack([lengths, steps]), axis=0, 
+        return_inverse=True)
+    fm_pairs = [_nearest_fm_pairs(key[1:1 + key[0]], None, True) 
+        if key[0] else None for key in keys]
+
+    notes = np.zeros((len(unique_chords), lengths.max(initial=0)))
+    for i, chord in enumerate(unique_chords):
+        notes[i, :len(chord.notes)] = chord.notes
+    ot_chords = nearest_ot_chords(notes, ot_subharm, lengths)
+
+    templates = []
+    for i, chord in enumerate(unique_chords):
+        if lengths[i] == 0:
+            # silent rows have no candidates
+            templates.append([])
+            continue
+        pairs = fm_pairs[fm_inverse.reshape(-1)[i]]
+        # solutions rougher than `fm_roughness` are never candidates
+        fm_solutions = _fm_solutions(chord.notes, *pairs, 
+            max_roughness=fm_roughness)
+        templates.append(_fm_ot_candidates(chord, fm_solutions, ot_chords[i], 
+            ot_dist, fm_roughness))
+
+    solutions = []
+    for idx, unique in enumerate(inverse):
+        if len(templates[unique]) == 0:
+            continue
+        candidate_chords = []
+        for candidate in templates[unique]:
+            candidate = dict(candidate)
+            if candidate["chord"] is unique_chords[unique]:
+                candidate["chord"] = Chord(matrix[idx], durations[idx])
+            else:
+                candidate["chord"] = copy.copy(candidate["chord"])
+            candidate_chords.append(candidate)
+        solutions.append({
+            "candidates":candidate_chords,
+            "idx":idx
+        })
+    return solutions
+
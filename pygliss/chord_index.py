@@ -0,0 +1,326 @@
+"""
+Nearest neighbour search over large collections of chords
+
+The chords are stored as quantized steps with inverted indexes from keys to
+the chords holding them: every note, and every pair of notes, of a chord.
+Within a key the chords are ordered by length, so the chords longer or
+shorter than a query are contiguous slices.
+
+A query walks shells of growing cost. A chord at distance `d` from the query
+holds a key of cost at most `d`: for a chord at least as long as the query,
+the pair of its notes nearest to the lowest and highest query notes; for a
+shorter chord, any pair of its notes, costed by their distances to the
+query. Once shell `d` is walked every chord within `d` has been met and
+scored exactly, so the walk stops at the distance of the k-th chord found.
+Pairs of notes are far more selective than single notes, so the chords met
+are mostly the ones close to the query and the work of a query grows much
+slower than the collection. The state of a query is kept for the chords met
+only. Queries with notes out of the range of the note vector score every
+chord.
+"""
+import numpy as np
+
+from pygliss.note import NOTE_VECTOR
+from pygliss.chord import get_chord_distance_matrix, padded_steps
+
+
+# posting codes hold the key above the length of the chord, longer chords
+# share the largest length
+LENGTH_BITS = 16
+MAX_LENGTH = (1 << LENGTH_BITS) - 1
+
+
+class ChordIndex:
+    """
+    A class to index chords for k nearest neighbour and radius queries under
+    `get_chord_distance`
+
+    Distances are measured from the query, `index.knn(chord, k)` gives the
+    same chords as sorting `chord.distance(stored)` over the collection, ties
+    broken by id. Chords get ids in order of insertion.
+
+    ...
+
+    Attributes
+    ----------
+        steps : 2D numpy.ndarray[numpy.int64]
+            the sorted steps of every chord, padded with 0
+        lengths : numpy.ndarray[numpy.int64]
+            the number of steps of every chord
+
+
+    Methods
+    -------
+        add(chords, lengths=None)
+            inserts chords and returns their ids
+
+        knn(chord, k, doublecount=True)
+            returns the ids and distances of the `k` nearest chords
+
+        radius(chord, radius, doublecount=True)
+            returns the ids and distances of the chords within `radius`
+
+        save(path)
+            writes the chords to a `.npz` file
+
+        load(path)
+            builds an index from a file written by `save`
+
+    """
+    def __init__(self, chords=None, lengths=None):
+        """
+        Contructs ChordIndex
+
+        Parameters
+        ----------
+            chords : list of pygliss.Chord, list of
+                numpy.ndarray[numpy.int64] or 2D numpy.ndarray[numpy.int64]
+                the chords to index, see `get_chord_distance_matrix`
+            lengths : numpy.ndarray[numpy.int64]
+                the number of steps of each row of a padded matrix
+        """
+        self.steps = np.zeros((0, 0), dtype=np.int64)
+        self.lengths = np.zeros(0, dtype=np.int64)
+        # postings of every note and every pair of notes of the chords, 
+        # sorted by code then id
+        self._note_codes = np.zeros(0, dtype=np.int64)
+        self._note_ids = np.zeros(0, dtype=np.int64)
+        self._pair_codes = np.zeros(0, dtype=np.int64)
+        self._pair_ids = np.zeros(0, dtype=np.int64)
+        # empty chords and chords with out of range notes, always scored
+        self._unkeyed = np.zeros(0, dtype=np.int64)
+        if chords is not None:
+            self.add(chords, lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, chords, lengths=None):
+        """
+        Inserts chords into the index
+
+        The postings of the new chords are merged into the sorted postings,
+        the existing ones are not sorted again. A chord of `n` notes adds
+        `n * (n + 1) / 2` postings.
+
+        Parameters
+        ----------
+            chords : list of pygliss.Chord, list of
+                numpy.ndarray[numpy.int64] or 2D numpy.ndarray[numpy.int64]
+                the chords to insert
+            lengths : numpy.ndarray[numpy.int64]
+                the number of steps of each row of a padded matrix
+
+        Returns
+        -------
+            ids : numpy.ndarray[numpy.int64]
+                the ids of the new chords
+        """
+        steps, lengths = padded_steps(chords, lengths)
+        ids = np.arange(len(self), len(self) + len(steps))
+        width = max(self.steps.shape[1], steps.shape[1])
+        self.steps = np.concatenate([
+            np.pad(self.steps, ((0, 0), (0, width - self.steps.shape[1]))),
+            np.pad(steps, ((0, 0), (0, width - steps.shape[1])))])
+        self.lengths = np.concatenate([self.lengths, lengths])
+
+        n_steps = len(NOTE_VECTOR)
+        valid = np.arange(steps.shape[1]) < lengths[:, np.newaxis]
+        keyed = (lengths > 0) & ((~valid) | ((steps >= 0) & 
+            (steps < n_steps))).all(axis=1)
+        self._unkeyed = np.concatenate([self._unkeyed, ids[~keyed]])
+        steps, lengths, ids = steps[keyed], lengths[keyed], ids[keyed]
+        valid = valid[keyed]
+        length_codes = np.minimum(lengths, MAX_LENGTH)[:, np.newaxis]
+
+        notes = (steps << LENGTH_BITS) | length_codes
+        self._note_codes, self._note_ids = _merged(self._note_codes, 
+            self._note_ids, notes[valid], 
+            np.broadcast_to(ids[:, np.newaxis], steps.shape)[valid])
+
+        # rows are sorted, the first note of a pair is the lower one
+        first, second = np.triu_indices(steps.shape[1], 1)
+        pairs = ((steps[:, first] * n_steps + steps[:, second]) << LENGTH_BITS
+            ) | length_codes
+        in_pair = valid[:, second]
+        self._pair_codes, self._pair_ids = _merged(self._pair_codes, 
+            self._pair_ids, pairs[in_pair], 
+            np.broadcast_to(ids[:, np.newaxis], pairs.shape)[in_pair])
+        return ids
+
+    def knn(self, chord, k, doublecount=True):
+        """
+        Find the `k` nearest chords of the index
+
+        Parameters
+        ----------
+            chord : pygliss.Chord or numpy.ndarray[numpy.int64]
+                the query chord or its steps
+            k : int
+                the number of chords returned
+            doublecount : bool
+                see `get_chord_distance`
+
+        Returns
+        -------
+            ids : numpy.ndarray[numpy.int64]
+                the ids of the nearest chords, closest first
+            dists : numpy.ndarray[numpy.int64]
+                the stepwise distance of each chord
+        """
+        ids, dists = self._search(chord, k, np.inf, doublecount)
+        return ids[:k], dists[:k]
+
+    def radius(self, chord, radius, doublecount=True):
+        """
+        Find every chord of the index within `radius` steps
+
+        Parameters
+        ----------
+            chord : pygliss.Chord or numpy.ndarray[numpy.int64]
+                the query chord or its steps
+            radius : int
+                the largest stepwise distance returned
+            doublecount : bool
+                see `get_chord_distance`
+
+        Returns
+        -------
+            ids : numpy.ndarray[numpy.int64]
+                the ids of the chords, closest first
+            dists : numpy.ndarray[numpy.int64]
+                the stepwise distance of each chord
+        """
+        ids, dists = self._search(chord, None, radius, doublecount)
+        within = dists <= radius
+        return ids[within], dists[within]
+
+    def save(self, path):
+        """Writes the chords of the index to a `.npz` file"""
+        np.savez(path, steps=self.steps, lengths=self.lengths)
+
+    @classmethod
+    def load(cls, path):
+        """Builds an index from the chords of a file written by `save`"""
+        with np.load(path) as data:
+            return cls(data["steps"], data["lengths"])
+
+    def _search(self, chord, k, threshold, doublecount):
+        """
+        Returns the ids and distances of the chords scored exactly, sorted
+        by distance then id, every chord closer than the k-th one or within
+        `threshold` is among them
+        """
+        query = np.sort(np.asarray(getattr(chord, "steps", chord),
+            dtype=np.int64))
+        n_chords, n_steps = len(self), len(NOTE_VECTOR)
+        exact = lambda ids: get_chord_distance_matrix(query[np.newaxis],
+            self.steps[ids], None, self.lengths[ids],
+            doublecount=doublecount)[0]
+        if len(query) == 0 or (query < 0).any() or (query >= n_steps).any():
+            # out of range notes are not in the postings, score every chord
+            return self._ranked(np.arange(n_chords),
+                exact(np.arange(n_chords)))
+
+        ring_of_step = np.abs(np.arange(n_steps)[:, np.newaxis] - 
+            query).min(axis=1)
+        # the chords met so far, sorted
+        seen = self._unkeyed
+        ids, dists = [seen], [exact(seen)]
+        # no key costs more than two notes at opposite ends of the range
+        for cost in range(2 * n_steps - 1):
+            if len(seen) == n_chords:
+                break
+            met = np.setdiff1d(self._shell(query, ring_of_step, cost), seen)
+            if len(met):
+                seen = np.union1d(seen, met)
+                ids.append(met)
+                dists.append(exact(met))
+            threshold = self._threshold(dists, k, threshold)
+            # every chord within `cost` has been met
+            if cost >= threshold:
+                break
+        return self._ranked(np.concatenate(ids), np.concatenate(dists))
+
+    def _shell(self, query, ring_of_step, cost):
+        """
+        Returns the ids of the chords holding a key of cost `cost`, with
+        repeats
+
+        A chord at least as long as the query is reached through the notes 
+        nearest to the lowest and the highest query note, the cost of a key 
+        is the sum of their distances to those notes. A shorter chord is 
+        reached through any two of its notes, or its only note, the cost of
+        a key is the sum of their distances to the nearest query note.
+        """
+        n_steps, n_query = len(NOTE_VECTOR), len(query)
+        in_range = lambda steps: (steps >= 0) & (steps < n_steps)
+        if n_query == 1:
+            near = np.unique(query[0] + np.array([-cost, cost]))
+            return self._postings(self._note_codes, self._note_ids, 
+                near[in_range(near)], 1, MAX_LENGTH)
+
+        shift = np.arange(-cost, cost + 1)
+        spare = cost - np.abs(shift)
+        lows = np.concatenate([query[0] + shift, query[0] + shift])
+        highs = np.concatenate([query[-1] + spare, query[-1] - spare])
+        inside = in_range(lows) & in_range(highs)
+        lows, highs = lows[inside], highs[inside]
+        same = lows == highs
+        pairs = np.minimum(lows, highs) * n_steps + np.maximum(lows, highs)
+        found = [self._postings(self._note_codes, self._note_ids, 
+                np.unique(lows[same]), n_query, MAX_LENGTH),
+            self._postings(self._pair_codes, self._pair_ids, 
+                np.unique(pairs[~same]), n_query, MAX_LENGTH)]
+
+        # chords shorter than the query
+        near = np.flatnonzero(ring_of_step <= cost)
+        firsts, seconds = np.meshgrid(near, near, indexing="ij")
+        keep = (firsts <= seconds) & (ring_of_step[firsts] + 
+            ring_of_step[seconds] == cost)
+        found.append(self._postings(self._pair_codes, self._pair_ids, 
+            firsts[keep] * n_steps + seconds[keep], 2, n_query - 1))
+        found.append(self._postings(self._note_codes, self._note_ids, 
+            np.flatnonzero(ring_of_step == cost), 1, 1))
+        return np.concatenate(found)
+
+    @staticmethod
+    def _postings(codes, ids, keys, shortest, longest):
+        """
+        Returns the ids of the chords of `shortest` to `longest` notes in the
+        postings of `keys`
+        """
+        starts = np.searchsorted(codes, (keys << LENGTH_BITS) | shortest)
+        ends = np.searchsorted(codes, (keys << LENGTH_BITS) | longest, 
+            side="right")
+        counts = np.maximum(ends - starts, 0)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - 
+            counts, counts)
+        return ids[np.repeat(starts, counts) + offsets]
+
+    @staticmethod
+    def _threshold(dists, k, threshold):
+        """Returns the distance of the k-th chord scored so far"""
+        if k is None:
+            return threshold
+        dists = np.concatenate(dists) if dists else np.zeros(0)
+        if len(dists) < k:
+            return threshold
+        return min(threshold, np.partition(dists, k - 1)[k - 1])
+
+    @staticmethod
+    def _ranked(ids, dists):
+        order = np.lexsort((ids, dists))
+        return ids[order], dists[order]
+
+
+def _merged(codes, ids, new_codes, new_ids):
+    """
+    Merges postings into sorted postings, the new ids are larger than the 
+    existing ones
+    """
+    order = np.argsort(new_codes, kind="stable")
+    # both runs are sorted, the stable sort merges them in linear time
+    codes = np.concatenate([codes, new_codes[order]])
+    merged = np.argsort(codes, kind="stable")
+    return codes[merged], np.concatenate([ids, new_ids[order]])[merged]
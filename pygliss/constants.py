@@ -7,3 +7,10 @@ LOW = 16.3515978313
 HIGH = 4300.0
 
 MAX_CHORD_LENGTH = 61
+MAX_SIDEBANDS = 30
+# partials of every note kept in the harmonic series table, enough for the
+# highest note of NOTE_VECTOR over the lowest usable fundamental
+HARMONIC_PARTIALS = 256
+
+# memory budget for the temporary arrays of the batch functions
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
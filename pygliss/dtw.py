@@ -0,0 +1,220 @@
+"""
+Dynamic time warping between chord sequences
+
+Sequences of different lengths and time grids are aligned row to row with
+`get_chord_distance` as the local cost. Costs and the warping table are
+stored in band coordinates, row `i` of a query against row `lo[i] + k` of a
+sequence, so with a Sakoe-Chiba window both grow linearly with the length
+of the sequences. Every row of the table is computed in one vectorized pass
+over all the sequences of a batch.
+"""
+import numpy as np
+
+from pygliss.constants import DEFAULT_MAX_BYTES
+from pygliss.chord import get_chord_distance_matrix
+from pygliss.note import find_note_vector_position_vectorized
+
+
+def dtw(chords1, chords2, window=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Aligns two chord sequences with dynamic time warping
+
+    Parameters
+    ----------
+        chords1, chords2 : pygliss.ChordSequence or 2D
+            numpy.ndarray[numpy.float64]
+            the sequences to align, one chord per row, silent voices stored
+            as 0.0
+        window : int
+            the Sakoe-Chiba radius, in rows of `chords2` around the diagonal
+            scaled to the lengths of the sequences. Every alignment is
+            considered if not specified
+        max_bytes : int
+            memory budget for the temporary arrays of the local costs
+
+    Returns
+    -------
+        path : 2D numpy.ndarray[numpy.int64]
+            the aligned (row of `chords1`, row of `chords2`) pairs, from the
+            first rows to the last
+        cost : int
+            the sum of the chord distances along the path
+    """
+    costs, paths = dtw_batch(chords1, [chords2], window, True, max_bytes)
+    return paths[0], costs[0]
+
+
+def dtw_batch(query, sequences, window=None, return_paths=False,
+    max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Aligns a query chord sequence with every sequence of a collection
+
+    Gives the same costs as calling `dtw` on each sequence. The local costs
+    of all sequences are computed together, block of query rows by block of
+    query rows, and the warping tables are filled for all sequences at once.
+
+    Parameters
+    ----------
+        query : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+            the query sequence, one chord per row
+        sequences : list of pygliss.ChordSequence or of 2D
+            numpy.ndarray[numpy.float64]
+            the sequences compared to the query
+        window : int
+            see `dtw`
+        return_paths : bool
+            whether the alignment paths are returned
+        max_bytes : int
+            see `dtw`
+
+    Returns
+    -------
+        costs : numpy.ndarray[numpy.int64]
+            the warping cost of every sequence
+        paths : list of 2D numpy.ndarray[numpy.int64]
+            the alignment path of every sequence, only if `return_paths`
+    """
+    query_steps, query_lengths = _sequence_steps(query)
+    steps, lengths = zip(*[_sequence_steps(seq) for seq in sequences]) \
+        if len(sequences) else ((), ())
+    n_rows = len(query_steps)
+    n_cols = np.array([len(seq) for seq in steps], dtype=np.int64)
+    if n_rows == 0 or (n_cols == 0).any():
+        raise ValueError("dtw needs sequences with at least one chord")
+
+    lo, hi = _band(n_rows, n_cols, window)
+    costs = _band_costs(query_steps, query_lengths, steps, lengths, lo, hi,
+        max_bytes)
+    table = _warping_table(costs, lo, hi)
+    last = hi[:, -1] - lo[:, -1]
+    warped = table[-1, np.arange(len(n_cols)), last]
+    if not return_paths:
+        return warped
+    return warped, [_backtrack(table[:, b], lo[b], hi[b])
+        for b in range(len(n_cols))]
+
+
+def _sequence_steps(chords):
+    """
+    Returns the sorted steps of every chord of a sequence, padded at the end
+    of each row, and the number of notes of each row
+    """
+    chords = np.asarray(getattr(chords, "chords", chords), dtype=np.float64)
+    chords = chords.reshape(len(chords), -1)
+    mask = chords > 0
+    steps = find_note_vector_position_vectorized(chords)
+    steps = np.sort(np.where(mask, steps, np.iinfo(np.int64).max), axis=1)
+    lengths = mask.sum(axis=1)
+    return np.where(np.arange(chords.shape[1]) < lengths[:, np.newaxis],
+        steps, 0), lengths
+
+
+def _band(n_rows, n_cols, window):
+    """
+    Returns the first and last column of every row of the Sakoe-Chiba band
+    of each sequence, shaped (sequence, row)
+    """
+    rows = np.arange(n_rows)
+    if window is None:
+        lo = np.zeros((len(n_cols), n_rows), dtype=np.int64)
+        return lo, np.broadcast_to((n_cols - 1)[:, np.newaxis], lo.shape).copy()
+    slope = (n_cols - 1) / max(n_rows - 1, 1)
+    center = rows * slope[:, np.newaxis]
+    # a radius of at least one row and the slope keeps the band connected
+    radius = np.maximum(np.maximum(window, 1), slope)[:, np.newaxis]
+    lo = np.maximum(np.ceil(center - radius), 0).astype(np.int64)
+    hi = np.minimum(np.floor(center + radius),
+        (n_cols - 1)[:, np.newaxis]).astype(np.int64)
+    return lo, hi
+
+
+def _band_costs(query_steps, query_lengths, steps, lengths, lo, hi, max_bytes):
+    """
+    Returns the chord distances of the band cells as a (row, sequence, k)
+    array for row `i` of the query against row `lo[i] + k` of each sequence,
+    cells past `hi[i]` are left at -1
+    """
+    n_seqs, n_rows = lo.shape
+    width = int((hi - lo).max()) + 1
+    offsets = np.concatenate([[0], np.cumsum([len(seq) for seq in steps])])
+    all_steps = np.concatenate([np.pad(seq, ((0, 0),
+        (0, max(seq.shape[1] for seq in steps) - seq.shape[1])))
+        for seq in steps])
+    all_lengths = np.concatenate(lengths)
+
+    costs = np.full((n_rows, n_seqs, width), -1, dtype=np.int64)
+    k = np.arange(width)
+    block = max(1, min(n_rows, width))
+    for start in range(0, n_rows, block):
+        rows = np.arange(start, min(start + block, n_rows))
+        # columns of each sequence used by the block, laid out one sequence
+        # after the other
+        first, last = lo[:, rows[0]], hi[:, rows[-1]]
+        starts = np.concatenate([[0], np.cumsum(last - first + 1)])
+        cols = np.concatenate([offsets[b] + np.arange(first[b], last[b] + 1)
+            for b in range(n_seqs)])
+        dists = get_chord_distance_matrix(query_steps[rows], all_steps[cols],
+            query_lengths[rows], all_lengths[cols], max_bytes)
+
+        j = lo[:, rows].T[:, :, np.newaxis] + k
+        in_band = j <= hi[:, rows].T[:, :, np.newaxis]
+        pos = starts[:-1, np.newaxis] + j - first[:, np.newaxis]
+        pos = np.where(in_band, pos, 0)
+        costs[rows] = np.where(in_band,
+            dists[np.arange(len(rows))[:, np.newaxis, np.newaxis], pos], -1)
+    return costs
+
+
+def _warping_table(costs, lo, hi):
+    """
+    Fills the warping table of every sequence in band coordinates
+
+    The least cost of a cell comes from the cell above, the one above on the
+    left or the one on its left. The last one is a running minimum along the
+    row, `table[k] = S[k] + min(a[l] - S[l] for l <= k)` with `S` the
+    cumulative costs of the row and `a` the cost of reaching each cell from
+    the row above, so a whole row is computed at once.
+    """
+    n_rows, n_seqs, width = costs.shape
+    far = 2 ** 40
+    k = np.arange(width)
+    seqs = np.arange(n_seqs)[:, np.newaxis]
+    table = np.full(costs.shape, far, dtype=np.int64)
+    prev = None
+    for i in range(n_rows):
+        in_band = costs[i] >= 0
+        cost = np.where(in_band, costs[i], far)
+        if prev is None:
+            above = np.where(k == 0, 0, far)
+        else:
+            # column j of the row above is at `j - lo[i - 1]`
+            shift = (lo[:, i] - lo[:, i - 1])[:, np.newaxis]
+            up, diag = k + shift, k + shift - 1
+            from_up = np.where((up >= 0) & (up < width),
+                prev[seqs, np.clip(up, 0, width - 1)], far)
+            from_diag = np.where((diag >= 0) & (diag < width),
+                prev[seqs, np.clip(diag, 0, width - 1)], far)
+            above = np.minimum(from_up, from_diag)
+        reach = np.minimum(above + cost, far)
+        cumulative = np.cumsum(cost, axis=1)
+        row = cumulative + np.minimum.accumulate(reach - cumulative, axis=1)
+        table[i] = prev = np.where(in_band, np.minimum(row, far), far)
+    return table
+
+
+def _backtrack(table, lo, hi):
+    """
+    Returns the alignment path ending in the last cell of the warping table
+    of one sequence, preferring diagonal steps, then vertical ones
+    """
+    far = 2 ** 40
+    width = table.shape[1]
+    value = lambda i, j: table[i, j - lo[i]] \
+        if i >= 0 and 0 <= j - lo[i] < width and lo[i] <= j <= hi[i] else far
+    i, j = len(lo) - 1, hi[-1]
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        moves = [(i - 1, j - 1), (i - 1, j), (i, j - 1)]
+        i, j = min(moves, key=lambda move: value(*move))
+        path.append((i, j))
+    return np.array(path[::-1], dtype=np.int64)
@@ -0,0 +1,169 @@
+"""
+Fingerprints of the quantized pitch content of chords
+
+The fingerprint of a chord is the sorted tuple of its steps, an exact key of
+its sonority that keeps doubled notes, so a unison doubling is told apart
+from the single note. The transposed fingerprint is the tuple of the
+intervals of its steps above the lowest one, the same for a chord and all
+its transpositions by any number of steps. Both are computed for a whole
+chord matrix at once and used as dictionary keys, so finding every
+occurrence of a sonority is a single lookup.
+"""
+import numpy as np
+
+from pygliss.note import find_note_vector_position_vectorized
+
+
+def chord_fingerprints(chords, lengths=None):
+    """
+    Returns the absolute and transposed fingerprints of every row of a chord
+    matrix
+
+    Silent voices, stored as 0.0, and notes out of the range of the note
+    vector are left out of the fingerprints.
+
+    Parameters
+    ----------
+        chords : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+            the chords to fingerprint, one chord per row
+        lengths : numpy.ndarray[numpy.int64]
+            the number of notes of each row when `chords` is padded, every
+            note of a row is used if not specified
+
+    Returns
+    -------
+        fingerprints : 2D numpy.ndarray[numpy.int64]
+            the sorted steps of every chord, padded at the end with -1
+        transposed : 2D numpy.ndarray[numpy.int64]
+            the sorted intervals of the steps of every chord above its lowest
+            step, padded at the end with -1
+        roots : numpy.ndarray[numpy.int64]
+            the lowest step of every chord, -1 for chords without notes
+    """
+    chords = np.asarray(getattr(chords, "chords", chords), dtype=np.float64)
+    chords = chords.reshape(len(chords), -1)
+    steps = find_note_vector_position_vectorized(chords)
+    mask = steps > 0
+    if lengths is not None:
+        mask &= np.arange(chords.shape[1]) < np.asarray(lengths)[:, np.newaxis]
+    # notes left out are sorted to the end of the row
+    fingerprints = np.sort(np.where(mask, steps, np.iinfo(np.int64).max), 
+        axis=1)
+    kept = np.arange(chords.shape[1]) < mask.sum(axis=1)[:, np.newaxis]
+    roots = np.where(kept[:, 0], fingerprints[:, 0], -1) if chords.shape[1] \
+        else np.full(len(chords), -1, dtype=np.int64)
+    transposed = np.where(kept, fingerprints - roots[:, np.newaxis], -1)
+    fingerprints = np.where(kept, fingerprints, -1)
+    return fingerprints, transposed, roots
+
+
+def _key(fingerprint):
+    """Returns the dictionary key of a fingerprint, whatever its padding"""
+    return fingerprint[fingerprint >= 0].tobytes()
+
+
+class FingerprintIndex:
+    """
+    A class to find every occurrence of a chord, or of its transpositions,
+    across chord sequences
+
+    ...
+
+    Attributes
+    ----------
+        n_sequences : int
+            the number of sequences added
+
+
+    Methods
+    -------
+        add(chords, lengths=None)
+            fingerprints the chords of a sequence and returns its id
+
+        occurrences(chord, transposed=False)
+            returns the sequence and row of every occurrence of `chord`
+
+    """
+    def __init__(self, sequences=None):
+        """
+        Contructs FingerprintIndex
+
+        Parameters
+        ----------
+            sequences : list of pygliss.ChordSequence or of 2D
+                numpy.ndarray[numpy.float64]
+                the sequences to index, their ids follow the list
+        """
+        self.n_sequences = 0
+        # fingerprint keys to the (sequence, row, root) of its occurrences
+        self._exact = {}
+        self._transposed = {}
+        for sequence in sequences or []:
+            self.add(sequence)
+
+    def add(self, chords, lengths=None):
+        """
+        Fingerprints the chords of a sequence and adds them to the index
+
+        Parameters
+        ----------
+            chords : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+                the chords of the sequence, one chord per row
+            lengths : numpy.ndarray[numpy.int64]
+                see `chord_fingerprints`
+
+        Returns
+        -------
+            sequence : int
+                the id of the sequence
+        """
+        sequence = self.n_sequences
+        self.n_sequences += 1
+        fingerprints, transposed, roots = chord_fingerprints(chords, lengths)
+        rows = np.stack([np.full(len(roots), sequence), np.arange(len(roots)),
+            roots], axis=1)
+        for table, prints in [(self._exact, fingerprints),
+            (self._transposed, transposed)]:
+            keys, inverse = np.unique(prints, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+            for i, key in enumerate(keys):
+                table.setdefault(_key(key), []).append(
+                    rows[order[bounds[i]:bounds[i + 1]]])
+        return sequence
+
+    def occurrences(self, chord, transposed=False):
+        """
+        Find every occurrence of a chord in the sequences of the index
+
+        Parameters
+        ----------
+            chord : pygliss.Chord or numpy.ndarray[numpy.float64]
+                the chord, or its frequencies
+            transposed : bool
+                set to True to also find the transpositions of the chord
+
+        Returns
+        -------
+            occurrences : 2D numpy.ndarray[numpy.int64]
+                the sequence and row of every occurrence, in order of
+                insertion of the sequences and of the rows. With `transposed`
+                a third column holds the transposition in steps from `chord`
+                to the occurrence
+        """
+        notes = np.asarray(getattr(chord, "notes", chord), dtype=np.float64)
+        fingerprints, normalized, roots = chord_fingerprints(notes[np.newaxis])
+        table = self._transposed if transposed else self._exact
+        key = _key((normalized if transposed else fingerprints)[0])
+        found = table.get(key)
+        if found is None:
+            return np.zeros((0, 3 if transposed else 2), dtype=np.int64)
+        if len(found) > 1:
+            # merge the sequences added since the last query
+            table[key] = found = [np.concatenate(found)]
+        found = found[0]
+        if not transposed:
+            return found[:, :2].copy()
+        shifts = np.where(roots[0] < 0, 0, found[:, 2] - roots[0])
+        return np.column_stack([found[:, :2], shifts])
@@ -274,5 +274,50 @@ def find_note_vector_position(note_frequency, trunc_beg=None, trunc_end=None):
 def find_closest_frequency(note_frequency, note_vector=NOTE_VECTOR):
     return note_vector[(np.abs(note_vector - note_frequency)).argmin()]
 
-find_note_vector_position_vectorized = np.vectorize(find_note_vector_position)
 
+def find_note_vector_position_vectorized(note_frequency, trunc_beg=None, 
+    trunc_end=None):
+    """
+    Finds note positions for an array of frequencies of any shape in one pass
+
+    Produces the same positions as `find_note_vector_position` applied to each
+    element. Each frequency is located in the sorted note vector with 
+    `np.searchsorted` and the closer of the two neighbouring notes is chosen, 
+    the lower note wins a tie just like `argmin`. NaN and frequencies so large 
+    that the distances round to the same value fall back to the `argmin` scan.
+
+    Values below the frequency range are set to -999999
+    
+    Parameters
+    ----------
+        note_frequency : np.array[np.float]
+            the input frequencies
+    Returns
+    -------
+        note_positions : np.array[np.int]
+            Array of position values for note frequency occurence in NOTE_VECTOR
+    """
+    note_vector = NOTE_VECTOR
+    if trunc_beg:
+        note_vector = note_vector[trunc_beg:]
+    if trunc_end:
+        note_vector = note_vector[:trunc_end]
+
+    freqs = np.asarray(note_frequency, dtype=np.float64)
+    upper = np.searchsorted(note_vector, freqs)
+    lower = np.clip(upper - 1, 0, len(note_vector) - 1)
+    upper = np.clip(upper, 0, len(note_vector) - 1)
+    upper_dist = np.abs(note_vector[upper] - freqs)
+    lower_dist = np.abs(note_vector[lower] - freqs)
+    note_positions = np.where(upper_dist < lower_dist, upper, lower).astype(np.int64)
+
+    # rounding flattens the distances for huge values, NaN never compares
+    below = np.clip(note_positions - 1, 0, len(note_vector) - 1)
+    flat = np.abs(note_vector[below] - freqs) == np.minimum(upper_dist, lower_dist)
+    rescan = np.isnan(freqs) | ((note_positions > 0) & flat)
+    if np.any(rescan):
+        note_positions[rescan] = np.abs(
+            note_vector - freqs[rescan][..., np.newaxis]).argmin(axis=-1)
+
+    note_positions = np.where(note_positions == 0, -999999, note_positions)
+    return note_positions
@@ -0,0 +1,252 @@
+"""
+Caches of chord search results
+
+Searches like `nearest_fm_chord` are pure functions of their canonical input
+and parameters. Their results are kept in two tiers: an in-process LRU
+dictionary bounded to `maxsize` entries, and, when `persist` is set, a
+SQLite file in the table cache directory that survives restarts and is
+shared by every process using the same directory.
+
+Results are stored as tuples of numpy arrays. The SQLite files are keyed by
+the tuning constants like the table cache files (see `pygliss.tables`), so
+changing a constant, `TABLE_CACHE_VERSION` or `RESULT_CACHE_VERSION` starts
+from an empty store. Bump `RESULT_CACHE_VERSION` whenever a cached search
+changes what it returns.
+"""
+import collections
+import io
+import os
+import sqlite3
+import numpy as np
+
+from pygliss.tables import cache_dir, cache_key, TABLE_CACHE_VERSION
+
+
+RESULT_CACHE_VERSION = 1
+# entries kept in memory by every result cache unless configured otherwise
+RESULT_CACHE_SIZE = 4096
+
+_CACHES = {}
+
+
+class ResultCache:
+    """
+    A class to represent a two tier cache of search results
+
+    ...
+
+    Attributes
+    ----------
+        name : str
+            the name of the cached search, also names its SQLite file
+        maxsize : int
+            the number of entries kept in memory, 0 keeps none
+        persist : bool
+            whether entries are also stored in the SQLite file
+        hits : int
+            lookups answered from memory
+        disk_hits : int
+            lookups answered from the SQLite file
+        misses : int
+            lookups not found in either tier
+
+
+    Methods
+    -------
+        get(key)
+            returns the result stored under `key`, None if there is none
+
+        put(key, result)
+            stores a result under `key`
+
+        clear(disk=False)
+            drops the entries held in memory, and the SQLite file if `disk`
+
+        stats()
+            returns the counters and the number of entries in memory
+
+    """
+    def __init__(self, name, maxsize=RESULT_CACHE_SIZE, persist=False):
+        """
+        Contructs ResultCache
+
+        Parameters
+        ----------
+            name : str
+                the name of the cached search
+            maxsize : int
+                the number of entries kept in memory
+            persist : bool
+                set to True to keep the entries in a SQLite file as well
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.persist = persist
+        self.hits = self.disk_hits = self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._connection = None
+        self._connection_key = None
+
+    def path(self):
+        """Returns the SQLite file of the cache, None when not persisted"""
+        directory = cache_dir()
+        if not self.persist or directory is None:
+            return None
+        return os.path.join(directory, f"{self.name}-v{TABLE_CACHE_VERSION}."
+            f"{RESULT_CACHE_VERSION}-{cache_key()}.sqlite")
+
+    def get(self, key):
+        """
+        Returns the result stored under `key`, None if there is none
+
+        Results found on disk are moved into memory.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        connection = self._connect()
+        if connection is not None:
+            try:
+                row = connection.execute(
+                    "SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                result = _decode(row[0])
+                self._remember(key, result)
+                self.disk_hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """
+        Stores a result under `key`
+
+        Parameters
+        ----------
+            key : bytes
+                the canonical input and parameters of the search
+            result : tuple of numpy.ndarray
+                the result, its arrays are made read only
+        """
+        result = tuple(np.array(value) for value in result)
+        for value in result:
+            value.flags.writeable = False
+        self._remember(key, result)
+        connection = self._connect()
+        if connection is not None:
+            try:
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO results "
+                        "VALUES (?, ?)", (key, _encode(result)))
+            except sqlite3.Error:
+                pass
+
+    def clear(self, disk=False):
+        """Drops the entries held in memory, and the SQLite file if `disk`"""
+        self._entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
+        if disk:
+            path = self.path()
+            self._close()
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def stats(self):
+        """Returns the counters and the number of entries in memory"""
+        return {"hits": self.hits, "disk_hits": self.disk_hits,
+            "misses": self.misses, "size": len(self._entries)}
+
+    def _remember(self, key, result):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _connect(self):
+        """
+        Returns the connection to the SQLite file, opened again when the
+        file changes or in a new process
+        """
+        path = self.path()
+        if path is None:
+            return None
+        if self._connection_key != (path, os.getpid()):
+            # a connection inherited through fork must not be used
+            self._connection = None
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                connection = sqlite3.connect(path, timeout=30)
+                connection.execute("CREATE TABLE IF NOT EXISTS results "
+                    "(key BLOB PRIMARY KEY, value BLOB)")
+                connection.commit()
+                self._connection = connection
+            except (OSError, sqlite3.Error):
+                pass
+            self._connection_key = (path, os.getpid())
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None and \
+            self._connection_key[1] == os.getpid():
+            self._connection.close()
+        self._connection = self._connection_key = None
+
+
+def get_result_cache(name):
+    """Returns result cache `name`, creating it on first use"""
+    if name not in _CACHES:
+        _CACHES[name] = ResultCache(name)
+    return _CACHES[name]
+
+
+def configure_result_caches(maxsize=None, persist=None):
+    """
+    Sets the memory bound and the SQLite tier of every result cache, the
+    settings left as None are not changed
+    """
+    for cache in _CACHES.values():
+        if maxsize is not None:
+            cache.maxsize = maxsize
+            while len(cache._entries) > max(maxsize, 0):
+                cache._entries.popitem(last=False)
+        if persist is not None:
+            cache.persist = persist
+
+
+def result_cache_info():
+    """Returns the counters of every result cache, keyed by name"""
+    return {name: cache.stats() for name, cache in _CACHES.items()}
+
+
+def clear_result_caches(disk=False):
+    """Drops the entries of every result cache, see `ResultCache.clear`"""
+    for cache in _CACHES.values():
+        cache.clear(disk)
+
+
+def result_key(values, *params):
+    """
+    Returns the cache key of a search over the canonical array `values` with
+    hashable parameters `params`
+    """
+    values = np.ascontiguousarray(values)
+    return repr((values.dtype.str,) + params).encode() + b"|" + values.tobytes()
+
+
+def _encode(result):
+    buffer = io.BytesIO()
+    np.savez(buffer, *result)
+    return buffer.getvalue()
+
+
+def _decode(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        result = tuple(data[f"arr_{i}"] for i in range(len(data.files)))
+    for value in result:
+        value.flags.writeable = False
+    return result
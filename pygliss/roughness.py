@@ -0,0 +1,394 @@
+"""
+Roughness of chords and spectra as defined by Vassilakis 2001,2005
+
+http://www.acousticslab.org/learnmoresra/moremodel.html
+
+Chords whose notes are quantized to NOTE_VECTOR can skip the model 
+altogether, their roughness is a sum over the `step_roughness` table of every
+step pair, see `quantized_roughness`.
+"""
+from pygliss.constants import DEFAULT_MAX_BYTES
+from pygliss.note import NOTE_VECTOR
+from pygliss.tables import get_table, register_table
+
+import functools
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def pair_indices(length):
+    """
+    Returns the first and second index of every pair of a chord with 
+    `length` notes, in the order of `itertools.combinations`
+    """
+    first, second = np.triu_indices(length, 1)
+    first.flags.writeable = False
+    second.flags.writeable = False
+    return first, second
+
+
+def amplitude_weight(amp_1, amp_2):
+    """
+    Returns the amplitude factor of the roughness of pairs of sine tones,
+    `pair_roughness` is this factor times the frequency term
+    """
+    A_min, A_max = np.minimum(amp_1, amp_2), np.maximum(amp_1, amp_2)
+    X = A_min * A_max
+    Y = 2 * A_min / (A_min + A_max)
+    return np.power(X, 0.1) * 0.5 * np.power(Y, 3.11)
+
+
+def pair_roughness(freq_1, freq_2, amp_1=1.0, amp_2=1.0):
+    """
+    Calculates the roughness of pairs of sine tones element by element
+
+    Parameters
+    ----------
+        freq_1, freq_2 : numpy.ndarray[numpy.float64]
+            the frequencies of the first and second tone of each pair
+        amp_1, amp_2 : numpy.ndarray[numpy.float64]
+            the amplitudes of the first and second tone of each pair
+
+    Returns
+    -------
+        roughness : numpy.ndarray[numpy.float64]
+            roughness of each pair as defined by Vassilakis
+    """
+    F_min, F_max = np.minimum(freq_1, freq_2), np.maximum(freq_1, freq_2)
+    b1, b2 = 3.5, 5.75
+    s1, s2 = 0.0207, 18.96
+    s = 0.24 / (s1 * F_min + s2)
+    Z = np.exp(-1 * b1 * s *(F_max - F_min)) - np.exp(-b2 * s * (F_max - F_min))    
+    return amplitude_weight(amp_1, amp_2) * Z
+
+
+def calc_roughness(chord_freq):
+    """
+    Calculates the roughness of a chord frequencies from Vassilakis 2001,2005
+    Ampltitude is set constant at 1
+
+    http://www.acousticslab.org/learnmoresra/moremodel.html
+
+
+    Parameters
+    ----------
+        chord_freq : numpy.ndarray[numpy.float64]
+            the frequencies of the input chord
+
+    Returns
+    -------
+        roughness : numpy.float64
+            roughness as defined by Vassilakis
+         
+    """
+    first, second = pair_indices(len(chord_freq))
+    return np.sum(pair_roughness(chord_freq[first], chord_freq[second]))
+
+
+def critical_bandwidth(freq):
+    """
+    Returns the critical bandwidth around `freq` implied by the roughness 
+    model, four times the frequency difference of maximum roughness (Plomp 
+    and Levelt 1965)
+    """
+    b1, b2 = 3.5, 5.75
+    s1, s2 = 0.0207, 18.96
+    # 1 / s of `pair_roughness`
+    return 4 * np.log(b2 / b1) / (b2 - b1) * (s1 * freq + s2) / 0.24
+
+
+def spectral_roughness(chord_freq, partials=8, rolloff=1.0, bandwidths=4.0):
+    """
+    Calculates the roughness of a chord of harmonic tones
+
+    Every note is expanded into `partials` harmonic partials, partial `k` 
+    has the amplitude `k ** -rolloff`. Only pairs of partials closer than 
+    `bandwidths` critical bandwidths are evaluated: the partials are sorted 
+    and each one is paired with the ones inside its window, farther pairs 
+    add almost no roughness (below 1e-4 of the peak pair roughness at the 
+    default of 4).
+
+    Parameters
+    ----------
+        chord_freq : numpy.ndarray[numpy.float64]
+            the frequencies of the input chord
+        partials : int
+            the number of partials of each note, the fundamental included
+        rolloff : float
+            the exponent of the amplitude rolloff of the partials, 0 for 
+            equal amplitudes
+        bandwidths : float
+            the width of the pair window in critical bandwidths, see 
+            `critical_bandwidth`
+
+    Returns
+    -------
+        roughness : numpy.float64
+            roughness as defined by Vassilakis
+    """
+    chord_freq = np.asarray(chord_freq, dtype=np.float64)
+    in_use = (chord_freq != 0.0)[np.newaxis]
+    return _spectral_roughness(chord_freq[np.newaxis], in_use, partials, 
+        rolloff, bandwidths)[0]
+
+
+def _spectral_roughness(chords, in_use, partials, rolloff, bandwidths):
+    n_rows = len(chords)
+    numbers = np.arange(1, partials + 1)
+    tones = (chords[:, :, np.newaxis] * numbers).reshape(n_rows, -1)
+    amps = np.broadcast_to(numbers ** -float(rolloff), 
+        chords.shape + (partials,)).reshape(n_rows, -1)
+    tones = np.where(np.repeat(in_use, partials, axis=1), tones, np.inf)
+
+    # sorted partials, padding last, each paired with the partials above it
+    # inside its window. Windows end in order, so once no pair is inside at 
+    # some distance none is at any larger distance
+    order = np.argsort(tones, axis=1)
+    tones = np.take_along_axis(tones, order, axis=1)
+    amps = np.take_along_axis(amps, order, axis=1)
+    reach = tones + bandwidths * critical_bandwidth(tones)
+    roughness = np.zeros(n_rows)
+    for offset in range(1, tones.shape[1]):
+        low, high = tones[:, :-offset], tones[:, offset:]
+        near = (high <= reach[:, :-offset]) & np.isfinite(high)
+        if not near.any():
+            break
+        pairs = pair_roughness(np.where(near, low, 1.0), np.where(near, high, 1.0),
+            amps[:, :-offset], amps[:, offset:])
+        roughness += np.where(near, pairs, 0.0).sum(axis=1)
+    return roughness
+
+
+def batch_roughness(chords, lengths=None, mask=None, 
+    max_bytes=DEFAULT_MAX_BYTES, partials=None, rolloff=1.0, bandwidths=4.0):
+    """
+    Calculates the roughness of every chord of a collection
+
+    The pairs of all rows are evaluated together in chunks, each chunk keeps
+    its temporary arrays under `max_bytes`. Silent notes (0.0, as inserted 
+    by `add_offset_at_position`) are left out, so silence rows have no 
+    roughness. Agrees with `calc_roughness` of the remaining notes of each 
+    row up to floating point rounding.
+
+    Parameters
+    ----------
+        chords : pygliss.ChordSequence, list of pygliss.Chord or 2D 
+            numpy.ndarray[numpy.float64]
+            the chords, one chord per row of a padded matrix
+        lengths : numpy.ndarray[numpy.int64]
+            the number of notes of each row when `chords` is padded
+        mask : numpy.ndarray[bool]
+            the notes in use, combined with `lengths`
+        max_bytes : int
+            memory budget for the temporary arrays of the pair evaluation
+        partials, rolloff, bandwidths :
+            set `partials` to expand every note into that many partials, see
+            `spectral_roughness`
+
+    Returns
+    -------
+        roughness : numpy.ndarray[numpy.float64]
+            roughness of every row as defined by Vassilakis
+    """
+    if isinstance(chords, (list, tuple)):
+        notes = [np.asarray(getattr(chord, "notes", chord), dtype=np.float64) 
+            for chord in chords]
+        offsets = np.cumsum([0] + [len(chord_notes) for chord_notes in notes])
+        return ragged_roughness(np.concatenate(notes + [np.zeros(0)]), offsets, 
+            max_bytes, partials, rolloff, bandwidths)
+
+    chords = np.asarray(getattr(chords, "chords", chords), dtype=np.float64)
+    valid = chords != 0.0
+    if lengths is not None:
+        valid &= np.arange(chords.shape[1]) < np.asarray(lengths)[:, np.newaxis]
+    if mask is not None:
+        valid &= mask
+
+    # move the notes in use to the front of each row, keeping their order
+    order = np.argsort(~valid, axis=1, kind="stable")
+    chords = np.take_along_axis(chords, order, axis=1)
+    counts = valid.sum(axis=1)
+
+    roughness = np.zeros(len(chords))
+    width = counts.max(initial=0)
+    if partials:
+        chords = chords[:, :width]
+        chunk = max(1, max_bytes // (12 * 8 * width * partials or 1))
+        for start in range(0, len(chords), chunk):
+            rows = slice(start, start + chunk)
+            in_use = np.arange(width) < counts[rows, np.newaxis]
+            roughness[rows] = _spectral_roughness(chords[rows], in_use, 
+                partials, rolloff, bandwidths)
+        return roughness
+
+    first, second = pair_indices(width)
+    chunk = max(1, max_bytes // (10 * 8 * len(first) or 1))
+    for start in range(0, len(chords), chunk):
+        rows = slice(start, start + chunk)
+        width = counts[rows].max(initial=0)
+        if width < 2:
+            continue
+        first, second = pair_indices(width)
+        notes = chords[rows, :width]
+        pairs = pair_roughness(notes[:, first], notes[:, second])
+        in_use = second < counts[rows, np.newaxis]
+        roughness[rows] = np.where(in_use, pairs, 0.0).sum(axis=1)
+    return roughness
+
+
+def ragged_roughness(notes, offsets, max_bytes=DEFAULT_MAX_BYTES, 
+    partials=None, rolloff=1.0, bandwidths=4.0):
+    """
+    Calculates the roughness of every chord of a CSR style ragged layout, 
+    see `batch_roughness`
+
+    Parameters
+    ----------
+        notes : numpy.ndarray[numpy.float64]
+            the notes of all chords, one chord after the other
+        offsets : numpy.ndarray[numpy.int64]
+            `notes[offsets[i]:offsets[i + 1]]` are the notes of chord `i`
+        max_bytes : int
+            memory budget for the temporary arrays of the pair evaluation
+        partials, rolloff, bandwidths :
+            see `batch_roughness`
+
+    Returns
+    -------
+        roughness : numpy.ndarray[numpy.float64]
+            roughness of every chord as defined by Vassilakis
+    """
+    notes = np.asarray(notes, dtype=np.float64)
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.arange(offsets[0], offsets[-1]) - offsets[rows]
+    chords = np.zeros((len(lengths), lengths.max(initial=0)))
+    chords[rows, positions] = notes[offsets[0]:offsets[-1]]
+    return batch_roughness(chords, max_bytes=max_bytes, partials=partials, 
+        rolloff=rolloff, bandwidths=bandwidths)
+
+
+def roughness_timeline(chords, refresh=256, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Calculates the roughness of every chord of a sequence incrementally
+
+    Consecutive chords of a sequence, e.g. a `GlissCmpr`, usually differ in 
+    one or two voices. Instead of summing all pairs of every chord, only the
+    pairs of the voices that changed are evaluated: the pairs of their old 
+    notes are subtracted from the running pair sum and the pairs of their 
+    new notes are added, O(n * changed) per chord instead of O(n^2). Every 
+    `refresh` chords the sum is recomputed from scratch to keep the rounding
+    error of the running sum bounded. Silent voices (0.0) add no roughness.
+
+    Parameters
+    ----------
+        chords : pygliss.ChordSequence or 2D numpy.ndarray[numpy.float64]
+            the sequence, one chord per row and one voice per column
+        refresh : int
+            the number of chords between exact recomputations
+        max_bytes : int
+            memory budget for the temporary arrays of the pair evaluation
+
+    Returns
+    -------
+        roughness : numpy.ndarray[numpy.float64]
+            roughness of every chord as defined by Vassilakis
+    """
+    chords = np.asarray(getattr(chords, "chords", chords), dtype=np.float64)
+    n_chords, n_voices = chords.shape
+    if n_chords == 0:
+        return np.zeros(0)
+
+    # every voice change, (chord, voice) with the chord after the change
+    rows, voices = np.nonzero(chords[1:] != chords[:-1])
+    rows = rows + 1
+    changed = np.zeros(chords.shape, dtype=bool)
+    changed[rows, voices] = True
+
+    # a pair between two changed voices is counted once, by its lower voice
+    others = np.arange(n_voices)
+    deltas = np.zeros(n_chords)
+    chunk = max(1, max_bytes // (2 * 10 * 8 * n_voices))
+    for start in range(0, len(rows), chunk):
+        row, voice = rows[start:start + chunk], voices[start:start + chunk]
+        counted = (others != voice[:, np.newaxis]) & \
+            ~(changed[row] & (others < voice[:, np.newaxis]))
+        delta = np.zeros(len(row))
+        for chord_rows, sign in [(row, 1.0), (row - 1, -1.0)]:
+            notes = chords[chord_rows]
+            note = notes[np.arange(len(row)), voice][:, np.newaxis]
+            in_use = counted & (notes != 0.0) & (note != 0.0)
+            pairs = pair_roughness(np.where(in_use, note, 1.0), 
+                np.where(in_use, notes, 1.0))
+            delta += sign * np.where(in_use, pairs, 0.0).sum(axis=1)
+        deltas += np.bincount(row, delta, minlength=n_chords)
+
+    # running sum restarted from an exact value every `refresh` chords
+    starts = np.arange(0, n_chords, refresh)
+    exact = batch_roughness(chords[starts], max_bytes=max_bytes)
+    segment = np.arange(n_chords) // refresh
+    deltas[starts] = 0.0
+    running = np.cumsum(deltas)
+    roughness = exact[segment] + running - running[starts][segment]
+    # chords with less than two notes are silent, not a rounding residue
+    roughness[np.count_nonzero(chords, axis=1) < 2] = 0.0
+    return roughness
+
+
+def step_roughness():
+    """
+    Returns the step x step table of the roughness of two unit amplitude 
+    tones of NOTE_VECTOR
+
+    Multiply by `2 * amplitude_weight(amp_1, amp_2)` for other amplitudes, 
+    the product is exactly `pair_roughness`.
+    """
+    return get_table("step_roughness")
+
+
+def quantized_roughness(steps, amps=None):
+    """
+    Calculates the roughness of chords quantized to NOTE_VECTOR by summing 
+    the `step_roughness` table over their step pairs
+
+    Gives the same value as `calc_roughness(NOTE_VECTOR[steps])`. Out of 
+    range steps (-999999) are silent and add no roughness.
+
+    Parameters
+    ----------
+        steps : numpy.ndarray[numpy.int64]
+            the steps of the chord notes, a 2D array holds one chord per row
+        amps : numpy.ndarray[numpy.float64]
+            the amplitude of every note, broadcast against `steps`, unit 
+            amplitudes if not specified
+
+    Returns
+    -------
+        roughness : numpy.float64 or numpy.ndarray[numpy.float64]
+            roughness of every chord as defined by Vassilakis
+    """
+    steps = np.asarray(steps)
+    first, second = pair_indices(steps.shape[-1])
+    silent = steps < 0
+    slots = np.where(silent, 0, steps) if silent.any() else steps
+    table = step_roughness()
+    pairs = np.take(table, slots[..., first] * len(table) + slots[..., second])
+    if amps is not None:
+        amps = np.broadcast_to(amps, steps.shape)
+        pairs = amplitude_weight(amps[..., first], amps[..., second]) * (2 * pairs)
+    if silent.any():
+        pairs = np.where(silent[..., first] | silent[..., second], 0.0, pairs)
+    if pairs.ndim == 1:
+        return np.sum(pairs)
+    # summed row by row, an axis sum adds in a different order than 
+    # `calc_roughness`
+    rows = pairs.reshape(int(np.prod(pairs.shape[:-1])), len(first))
+    return np.array([np.sum(row) for row in rows]).reshape(pairs.shape[:-1])
+
+
+def _build_step_roughness():
+    return pair_roughness(NOTE_VECTOR[:, np.newaxis], NOTE_VECTOR)
+
+
+register_table("step_roughness", _build_step_roughness)
@@ -2,6 +2,7 @@ import copy
 import numpy as np
 from pygliss.note import freq_to_note
 from pygliss.chord import Chord
+from pygliss.roughness import roughness_timeline
 
 class NoteSequence:
 	"""
@@ -150,6 +151,8 @@ class ChordSequence:
 	-------
 	to_chord:
 		returns a list of Chord objects from the Chord sequence
+	roughness:
+		returns the roughness of every chord of the sequence
 	"""
 	def __init__(self, chords, time_val, durations, beats=None):
 		self.chords = chords
@@ -172,6 +175,13 @@ class ChordSequence:
 		"""Returns list of Chord objects from Chord sequence"""
 		return [Chord(self.chords[i], self.durations[i]) for i in range(self.length)]
 
+	def roughness(self, refresh=256):
+		"""
+		Returns the roughness of every chord, updated incrementally along the 
+		sequence, see `pygliss.roughness.roughness_timeline`
+		"""
+		return roughness_timeline(self.chords, refresh)
+
 	def concat(self, other):
 	    """
 	    Concat two ChordSequence sequences and returns a new instance  of 
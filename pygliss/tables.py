@@ -0,0 +1,564 @@
+"""
+Lookup tables used by the FM chord search
+
+Tables are built on first use and saved as `.npy` files in the cache 
+directory. Later runs load them with `mmap_mode='r'` so start up is nearly free
+and the pages are shared between processes. Cache files are keyed by the 
+tuning constants and `TABLE_CACHE_VERSION`, bump the version whenever a 
+builder changes what it produces. Writing a table removes its files of 
+other versions.
+
+All FM data comes from one carrier x sideband x modulator tensor, the 
+`fm_spectra` table, whose rows are the sum tones, the difference tones and 
+the carrier. The sum, difference and carrier rows are handed out as views 
+(see `FM_SUM_ROWS`, `FM_DIFF_ROWS`, `FM_TONE_ROWS` and `FM_CARRIER_ROW`). 
+Quantized steps are kept as int16 in `fm_spectra_steps`, out of range tones 
+are stored as `FM_STEP_SENTINEL` instead of -999999, use `expand_steps` to 
+get the values `find_note_vector_position_vectorized` would return.
+
+Worker processes can share one copy of the tables instead of each loading 
+their own. `SharedTables` publishes the tables in `multiprocessing` shared 
+memory and hands out a pool initializer that attaches the workers zero copy. 
+The memory mapped disk cache also shares its pages between processes but 
+leaves the tables on disk.
+
+The cache directory defaults to `~/.cache/pygliss` and can be changed with the
+`PYGLISS_CACHE_DIR` environment variable, set it to an empty string to keep 
+the tables in memory only.
+
+The harmonic series of every note of NOTE_VECTOR is kept quantized in the 
+fundamental x partial `harmonic_steps` table, with the inverse map from step 
+to (fundamental, partial) in `harmonic_step_index`. Overtone chord matching 
+reads the steps of its candidate chords from it.
+"""
+import functools
+import hashlib
+import os
+import re
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+
+from pygliss.constants import DIVISIONS, A440, LOW, HIGH, MAX_SIDEBANDS, \
+    HARMONIC_PARTIALS
+from pygliss.note import NOTE_VECTOR, find_note_vector_position_vectorized
+from pygliss.bitset import ChordBitset
+
+
+TABLE_CACHE_VERSION = 3
+FREQ_MODULATORS = np.outer(np.arange(1, MAX_SIDEBANDS+1), NOTE_VECTOR)
+
+FM_SUM_ROWS = slice(0, MAX_SIDEBANDS)
+FM_DIFF_ROWS = slice(MAX_SIDEBANDS, MAX_SIDEBANDS * 2)
+FM_TONE_ROWS = slice(0, MAX_SIDEBANDS * 2)
+FM_CARRIER_ROW = MAX_SIDEBANDS * 2
+FM_STEP_SENTINEL = np.iinfo(np.int16).min
+
+# number of reduced sideband tables kept by `fm_sideband_steps`
+SIDEBAND_CACHE_SIZE = 8
+
+_BUILDERS = {}
+_TABLES = {}
+SHARED_TABLES = []
+_ATTACHED = []
+
+
+def cache_dir():
+    """Returns the table cache directory, None when disk caching is disabled"""
+    path = os.environ.get("PYGLISS_CACHE_DIR")
+    if path is None:
+        path = os.path.join(os.path.expanduser("~"), ".cache", "pygliss")
+    return path or None
+
+
+def cache_key():
+    """Returns a short hash of the constants the tables are derived from"""
+    constants = (f"{DIVISIONS}-{A440!r}-{LOW!r}-{HIGH!r}-{MAX_SIDEBANDS}-"
+        f"{HARMONIC_PARTIALS}")
+    return hashlib.sha1(constants.encode()).hexdigest()[:12]
+
+
+def cache_path(name):
+    """Returns the `.npy` cache file of table `name`"""
+    directory = cache_dir()
+    if directory is None:
+        return None
+    return os.path.join(directory, 
+        f"{name}-v{TABLE_CACHE_VERSION}-{cache_key()}.npy")
+
+
+def register_table(name, builder, shared=True):
+    """
+    Registers `builder`, a function without arguments returning a 
+    numpy.ndarray, as the source of table `name`
+
+    Tables registered with `shared` = True are published by `SharedTables` 
+    unless other names are requested
+    """
+    _BUILDERS[name] = builder
+    if shared and name not in SHARED_TABLES:
+        SHARED_TABLES.append(name)
+
+
+def get_table(name):
+    """
+    Returns table `name`, loading it from the disk cache or building it on 
+    first use
+    """
+    if name not in _TABLES:
+        _TABLES[name] = _load_or_build(name)
+    return _TABLES[name]
+
+
+def table_nbytes():
+    """Returns the number of bytes of every table currently held in memory"""
+    return {name:table.nbytes for name, table in _TABLES.items()}
+
+
+def fm_spectra(dtype=np.float64):
+    """
+    Returns the carrier x sideband x modulator FM frequency table 
+    
+    Rows are the sum tones, difference tones and the carrier. Pass 
+    `dtype=np.float32` for a half size copy of the table.
+    """
+    if np.dtype(dtype) == np.float32:
+        return get_table("fm_spectra_f32")
+    return get_table("fm_spectra")
+
+
+def fm_spectra_steps():
+    """Returns the int16 steps of `fm_spectra`"""
+    return get_table("fm_spectra_steps")
+
+
+def fm_roughness(sidebands=None):
+    """
+    Returns the carrier x modulator table of FM chord roughness
+
+    Each entry is the roughness of the sum and difference tones of the first 
+    `sidebands` sidebands, the carrier is not included. Use it to rule out 
+    regions of the FM space before any distance work, e.g. 
+    `fm_roughness() <= 10`
+
+    Parameters
+    ----------
+        sidebands : int
+            the number of sidebands considered, uses MAX_SIDEBANDS if not
+            specified
+    """
+    return get_table("fm_roughness")[sideband_count(sidebands) - 1]
+
+
+def sideband_count(sidebands=None):
+    """
+    Returns the number of sidebands used for `sidebands`, None and 0 mean 
+    MAX_SIDEBANDS and larger counts are capped to it
+    """
+    if not sidebands:
+        return MAX_SIDEBANDS
+    if sidebands < 1:
+        raise ValueError(f"sidebands must be at least 1, got {sidebands}")
+    return min(sidebands, MAX_SIDEBANDS)
+
+
+def fm_tone_rows(sidebands=None):
+    """
+    Returns the `fm_spectra` rows of the sum and difference tones of the 
+    first `sidebands` sidebands
+    """
+    sidebands = sideband_count(sidebands)
+    return np.r_[0:sidebands, MAX_SIDEBANDS:MAX_SIDEBANDS + sidebands]
+
+
+def fm_sideband_steps(sidebands=None):
+    """
+    Returns the steps table limited to the first `sidebands` sum and 
+    difference tones followed by the carrier
+
+    The reduced tables are built once per sideband count and the last 
+    `SIDEBAND_CACHE_SIZE` of them are kept, so sweeps at a fixed sideband 
+    count never reallocate. The full table is returned for MAX_SIDEBANDS.
+    """
+    return _fm_sideband_tables(sideband_count(sidebands))[0]
+
+
+def fm_sideband_step_index(sidebands=None):
+    """
+    Returns the inverted index of `fm_sideband_steps`, see `build_step_index`
+    """
+    return _fm_sideband_tables(sideband_count(sidebands))[1:3]
+
+
+def fm_sideband_bitsets(sidebands=None):
+    """
+    Returns the carrier x modulator x word bitsets of `fm_sideband_steps`, 
+    see `pygliss.bitset.ChordBitset`
+    """
+    return _fm_sideband_tables(sideband_count(sidebands))[3]
+
+
+@functools.lru_cache(maxsize=SIDEBAND_CACHE_SIZE)
+def _fm_sideband_tables(sidebands):
+    if sidebands == MAX_SIDEBANDS:
+        return (fm_spectra_steps(),) + fm_step_index() + (fm_step_bitsets(),)
+    rows = np.append(fm_tone_rows(sidebands), FM_CARRIER_ROW)
+    steps = np.ascontiguousarray(fm_spectra_steps()[:, rows, :])
+    steps.flags.writeable = False
+    bitsets = _step_bitsets(steps)
+    bitsets.flags.writeable = False
+    return (steps,) + build_step_index(steps) + (bitsets,)
+
+
+def fm_step_bitsets():
+    """
+    Returns the carrier x modulator x word bitsets of the steps of every FM 
+    chord with its carrier, see `pygliss.bitset.ChordBitset`
+    """
+    return get_table("fm_step_bitsets")
+
+
+def fm_step_index():
+    """
+    Returns the inverted index of `fm_spectra_steps`, see `build_step_index`
+    """
+    return get_table("fm_step_index_offsets"), get_table("fm_step_index_pairs")
+
+
+def build_step_index(steps):
+    """
+    Builds an inverted index from quantized step to the (carrier, modulator)
+    pairs with a tone at that step
+
+    Pairs are stored flat as `carrier * len(NOTE_VECTOR) + modulator`. Slot 0
+    holds the pairs with out of range tones, position 0 is never returned by
+    the quantizer.
+
+    Parameters
+    ----------
+        steps : numpy.ndarray[numpy.int16]
+            carrier x sideband x modulator table of steps
+
+    Returns
+    -------
+        offsets : numpy.ndarray[numpy.int64]
+            `pairs[offsets[s]:offsets[s + 1]]` are the pairs with a tone at 
+            step `s`
+        pairs : numpy.ndarray[numpy.int32]
+            the flat (carrier, modulator) pairs sorted by step
+    """
+    n_carriers, _, n_modulators = steps.shape
+    n_pairs = n_carriers * n_modulators
+    slots = np.where(steps == FM_STEP_SENTINEL, 0, steps).astype(np.int64)
+    pairs = (np.arange(n_carriers)[:, np.newaxis, np.newaxis] * n_modulators 
+        + np.arange(n_modulators))
+    keys = np.unique(slots * n_pairs + pairs)
+    offsets = np.searchsorted(keys // n_pairs, np.arange(len(NOTE_VECTOR) + 1))
+    return offsets, (keys % n_pairs).astype(np.int32)
+
+
+def harmonic_steps(partials=None):
+    """
+    Returns the fundamental x partial table of quantized harmonic steps
+
+    Entry `[f, k - 1]` is the int16 step of partial `k` of `NOTE_VECTOR[f]`,
+    out of range partials are stored as `FM_STEP_SENTINEL`. Partials past 
+    HARMONIC_PARTIALS are computed on the fly.
+
+    Parameters
+    ----------
+        partials : int
+            the number of partials, uses HARMONIC_PARTIALS if not specified
+    """
+    if partials is None or partials <= HARMONIC_PARTIALS:
+        return get_table("harmonic_steps")[:, :partials]
+    return _harmonic_steps(partials)
+
+
+def harmonic_step_index():
+    """
+    Returns the inverse of `harmonic_steps`, from step to the (fundamental, 
+    partial) pairs sounding it
+
+    Pairs are stored flat, `divmod(pairs, HARMONIC_PARTIALS)` gives the 
+    fundamental position and the partial number minus one. See 
+    `build_step_index` for the layout.
+    """
+    return (get_table("harmonic_step_index_offsets"), 
+        get_table("harmonic_step_index_pairs"))
+
+
+def lookup_harmonic_steps(fundamentals, partials):
+    """
+    Returns the steps `find_note_vector_position_vectorized` gives for 
+    `NOTE_VECTOR[fundamentals] * partials` from the harmonic series table
+
+    Parameters
+    ----------
+        fundamentals : numpy.ndarray[numpy.int64]
+            positions of the fundamentals in NOTE_VECTOR
+        partials : numpy.ndarray[numpy.int64]
+            partial numbers, broadcast against `fundamentals`, partial 0 is
+            silence
+
+    Returns
+    -------
+        steps : numpy.ndarray[numpy.int64]
+    """
+    fundamentals, partials = np.broadcast_arrays(fundamentals, partials)
+    in_table = (partials >= 1) & (partials <= HARMONIC_PARTIALS)
+    steps = expand_steps(get_table("harmonic_steps")[fundamentals, 
+        np.clip(partials - 1, 0, HARMONIC_PARTIALS - 1)])
+    steps = np.where(partials == 0, -999999, steps)
+    outside = ~in_table & (partials != 0)
+    if outside.any():
+        steps[outside] = find_note_vector_position_vectorized(
+            NOTE_VECTOR[fundamentals[outside]] * partials[outside].astype(np.float64))
+    return steps
+
+
+def expand_steps(steps):
+    """
+    Converts int16 table steps to int64 with out of range tones set to 
+    -999999, matching `find_note_vector_position_vectorized`
+    """
+    steps = np.asarray(steps, dtype=np.int64)
+    return np.where(steps == FM_STEP_SENTINEL, -999999, steps)
+
+
+def clear_tables():
+    """Drops the tables held in memory, the disk cache is left untouched"""
+    _TABLES.clear()
+    _fm_sideband_tables.cache_clear()
+
+
+class SharedTables:
+    """
+    Publishes lookup tables in shared memory for a pool of worker processes
+
+    The tables are built or loaded once in the parent and copied into 
+    `multiprocessing.shared_memory` segments. Workers started with 
+    `initializer` and `initargs` attach to the segments without copying. 
+    The segments are removed by `close`, or when the `with` block ends
+
+    Example
+    -------
+        with SharedTables() as shared:
+            with multiprocessing.Pool(8, shared.initializer, shared.initargs) as pool:
+                solutions = pool.map(nearest_fm_chord, chords)
+
+    ...
+
+    Attributes
+    ----------
+        spec : dict
+            segment name, shape and dtype of every published table, keyed by
+            table name
+
+    Methods
+    -------
+        close()
+            releases and removes the shared memory segments
+    """
+
+    def __init__(self, names=None):
+        """
+        Contructs SharedTables
+
+        Parameters
+        ----------
+            names : list of str
+                the tables to publish, defaults to `SHARED_TABLES`
+        """
+        self.spec = {}
+        self._segments = []
+        try:
+            for name in (SHARED_TABLES if names is None else names):
+                table = get_table(name)
+                segment = shared_memory.SharedMemory(create=True, 
+                    size=max(table.nbytes, 1))
+                self._segments.append(segment)
+                shared = np.ndarray(table.shape, table.dtype, buffer=segment.buf)
+                shared[...] = table
+                self.spec[name] = (segment.name, table.shape, table.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def initializer(self):
+        return attach_shared_tables
+
+    @property
+    def initargs(self):
+        return (self.spec,)
+
+    def close(self):
+        """Releases and removes the shared memory segments"""
+        while self._segments:
+            segment = self._segments.pop()
+            segment.close()
+            segment.unlink()
+
+
+def attach_shared_tables(spec):
+    """
+    Attaches to tables published by `SharedTables`, use as the initializer of
+    worker processes
+
+    Parameters
+    ----------
+        spec : dict
+            `SharedTables.spec` of the publishing process
+    """
+    for name, (segment_name, shape, dtype) in spec.items():
+        if sys.version_info >= (3, 13):
+            segment = shared_memory.SharedMemory(segment_name, track=False)
+        else:
+            # workers share the parent's resource tracker, which already 
+            # knows the segment, so registering it again is harmless
+            segment = shared_memory.SharedMemory(segment_name)
+        _ATTACHED.append(segment)
+        table = np.ndarray(shape, np.dtype(dtype), buffer=segment.buf)
+        table.flags.writeable = False
+        _TABLES[name] = table
+    _fm_sideband_tables.cache_clear()
+
+
+def _load_or_build(name):
+    path = cache_path(name)
+    if path is not None:
+        try:
+            # a plain ndarray view of the map, numpy.memmap adds overhead to 
+            # every operation on its results
+            return np.load(path, mmap_mode='r').view(np.ndarray)
+        except (OSError, ValueError):
+            pass
+
+    table = _BUILDERS[name]()
+    if path is not None:
+        # write to a temporary file first so readers never see a partial table
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp_path, path)
+            _remove_stale(name, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return table
+
+
+def _remove_stale(name, path):
+    """
+    Removes the cache files of table `name` written by other versions of 
+    the builders, files of other tuning constants are kept
+    """
+    directory = os.path.dirname(path)
+    pattern = re.compile(rf"{re.escape(name)}-v(\d+)-[0-9a-f]+\.npy")
+    for file_name in os.listdir(directory):
+        match = pattern.fullmatch(file_name)
+        if match and int(match.group(1)) != TABLE_CACHE_VERSION:
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+
+
+def _build_fm_spectra(dtype=np.float64):
+    spectra = np.empty((len(NOTE_VECTOR), FM_CARRIER_ROW + 1, len(NOTE_VECTOR)), 
+        dtype=dtype)
+    # tones are computed in float64 one carrier at a time, other dtypes are
+    # rounded once from the same values without a float64 table
+    for carrier, freq in enumerate(NOTE_VECTOR):
+        spectra[carrier, FM_SUM_ROWS, :] = freq + FREQ_MODULATORS
+        spectra[carrier, FM_DIFF_ROWS, :] = np.abs(freq - FREQ_MODULATORS)
+        spectra[carrier, FM_CARRIER_ROW, :] = freq
+    return spectra
+
+
+def _build_fm_spectra_f32():
+    return _build_fm_spectra(np.float32)
+
+
+def _build_fm_spectra_steps():
+    steps = find_note_vector_position_vectorized(get_table("fm_spectra"))
+    return np.where(steps == -999999, FM_STEP_SENTINEL, steps).astype(np.int16)
+
+
+def _build_fm_roughness():
+    # imported here, pygliss.roughness registers its own tables with this module
+    from pygliss.roughness import pair_roughness
+
+    # tone pairs in the order of `calc_roughness`, each pair is counted from 
+    # the sideband count where both of its tones are present
+    first, second = np.triu_indices(MAX_SIDEBANDS * 2, 1)
+    tone_sidebands = np.arange(MAX_SIDEBANDS * 2) % MAX_SIDEBANDS
+    pair_sidebands = np.maximum(tone_sidebands[first], tone_sidebands[second])
+    by_sidebands = (pair_sidebands[:, np.newaxis] == np.arange(MAX_SIDEBANDS))
+
+    spectra = get_table("fm_spectra")
+    roughness = np.empty((MAX_SIDEBANDS, len(NOTE_VECTOR), len(NOTE_VECTOR)))
+    for carrier in range(len(NOTE_VECTOR)):
+        tones = spectra[carrier, FM_TONE_ROWS, :].T
+        pairs = pair_roughness(tones[:, first], tones[:, second])
+        roughness[:, carrier, :] = np.cumsum(pairs @ by_sidebands, axis=1).T
+        # summed row by row like `calc_roughness` so the full spectrum values 
+        # match it exactly, an axis sum adds in a different order
+        roughness[-1, carrier, :] = [np.sum(row) for row in pairs]
+    return roughness
+
+
+def _build_fm_step_index_offsets():
+    return build_step_index(get_table("fm_spectra_steps"))[0]
+
+
+def _build_fm_step_index_pairs():
+    return build_step_index(get_table("fm_spectra_steps"))[1]
+
+
+def _step_bitsets(steps):
+    return ChordBitset.from_steps(np.swapaxes(steps, 1, 2)).words
+
+
+def _build_fm_step_bitsets():
+    return _step_bitsets(get_table("fm_spectra_steps"))
+
+
+def _harmonic_steps(partials):
+    steps = find_note_vector_position_vectorized(
+        NOTE_VECTOR[:, np.newaxis] * np.arange(1, partials + 1))
+    return np.where(steps == -999999, FM_STEP_SENTINEL, steps).astype(np.int16)
+
+
+def _build_harmonic_steps():
+    return _harmonic_steps(HARMONIC_PARTIALS)
+
+
+def _build_harmonic_step_index_offsets():
+    # one "carrier" per fundamental and one "modulator" per partial
+    return build_step_index(get_table("harmonic_steps")[:, np.newaxis, :])[0]
+
+
+def _build_harmonic_step_index_pairs():
+    return build_step_index(get_table("harmonic_steps")[:, np.newaxis, :])[1]
+
+
+register_table("fm_spectra", _build_fm_spectra)
+register_table("fm_spectra_f32", _build_fm_spectra_f32, shared=False)
+register_table("fm_spectra_steps", _build_fm_spectra_steps)
+register_table("fm_roughness", _build_fm_roughness)
+register_table("fm_step_index_offsets", _build_fm_step_index_offsets)
+register_table("fm_step_index_pairs", _build_fm_step_index_pairs)
+register_table("fm_step_bitsets", _build_fm_step_bitsets)
+register_table("harmonic_steps", _build_harmonic_steps)
+register_table("harmonic_step_index_offsets", _build_harmonic_step_index_offsets)
+register_table("harmonic_step_index_pairs", _build_harmonic_step_index_pairs)
@@ -0,0 +1,76 @@
+"""
+Voice leading through the candidates of `filter_fm_ot_chords`
+
+Every chord index offers a few candidate chords. A Viterbi pass picks one
+candidate per index so that the weighted sum of the roughness of the chosen
+chords and of the stepwise distance between consecutive ones is the least
+over the whole sequence.
+"""
+import numpy as np
+
+from pygliss.constants import DEFAULT_MAX_BYTES
+from pygliss.chord import get_chord_distance_matrix, padded_steps
+from pygliss.roughness import batch_roughness
+
+
+def optimal_voice_leading(solutions, distance_weight=1.0, roughness_weight=1.0,
+    doublecount=True, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Finds the sequence of candidates with the least total cost
+
+    The cost of a sequence is `roughness_weight` times the roughness of each
+    chosen chord plus `distance_weight` times `get_chord_distance` from each
+    chosen chord to the next one. Ties go to the candidate listed first.
+
+    Parameters
+    ----------
+        solutions : list of dict
+            the output of `filter_fm_ot_chords`, the `chord` of every
+            candidate is used. Lists of pygliss.Chord are also accepted in
+            place of the `candidates` of each entry
+        distance_weight : float
+            weight of the stepwise distance between consecutive chords
+        roughness_weight : float
+            weight of the roughness of every chord, see `batch_roughness`
+        doublecount : bool
+            see `get_chord_distance`
+        max_bytes : int
+            memory budget for the temporary arrays of the distances
+
+    Returns
+    -------
+        choices : numpy.ndarray[numpy.int64]
+            the index of the chosen candidate of every entry of `solutions`
+        cost : numpy.float64
+            the total cost of the chosen sequence
+    """
+    chords = [[cand["chord"] if isinstance(cand, dict) else cand
+        for cand in (sol["candidates"] if isinstance(sol, dict) else sol)]
+        for sol in solutions]
+    if len(chords) == 0:
+        return np.zeros(0, dtype=np.int64), np.float64(0.0)
+    if any(len(cands) == 0 for cands in chords):
+        raise ValueError("every chord index needs at least one candidate")
+
+    flat = [chord for cands in chords for chord in cands]
+    offsets = np.cumsum([0] + [len(cands) for cands in chords])
+    emissions = roughness_weight * batch_roughness(flat, max_bytes=max_bytes)
+    steps, lengths = padded_steps(flat)
+
+    cost = emissions[offsets[0]:offsets[1]]
+    backpointers = []
+    for t in range(1, len(chords)):
+        prev = slice(offsets[t - 1], offsets[t])
+        cur = slice(offsets[t], offsets[t + 1])
+        transitions = get_chord_distance_matrix(steps[prev], steps[cur],
+            lengths[prev], lengths[cur], max_bytes, doublecount)
+        total = cost[:, np.newaxis] + distance_weight * transitions
+        best = np.argmin(total, axis=0)
+        backpointers.append(best)
+        cost = total[best, np.arange(len(best))] + emissions[cur]
+
+    choices = np.zeros(len(chords), dtype=np.int64)
+    choices[-1] = np.argmin(cost)
+    for t in range(len(chords) - 1, 0, -1):
+        choices[t - 1] = backpointers[t - 1][choices[t]]
+    return choices, cost[choices[-1]]
@@ -0,0 +1,14 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# tables built by the tests are cached in a directory of the run, not in the
+# cache of the user, and removed when the run ends. Worker processes started
+# by the tests use the directory of the run
+CACHE_DIR = os.environ.get("PYGLISS_TESTS_CACHE_DIR")
+if CACHE_DIR is None:
+	CACHE_DIR = tempfile.mkdtemp(prefix="pygliss-tests-")
+	os.environ["PYGLISS_TESTS_CACHE_DIR"] = CACHE_DIR
+	atexit.register(shutil.rmtree, CACHE_DIR, True)
+os.environ["PYGLISS_CACHE_DIR"] = CACHE_DIR
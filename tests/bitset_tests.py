@@ -0,0 +1,35 @@
+import unittest
+import pygliss
+import numpy as np
+
+class TestBitsetMethods(unittest.TestCase):
+
+	def test_from_steps(self):
+		bits = pygliss.bitset.ChordBitset.from_steps(np.array([1, 63, 64, 193, 64]))
+		self.assertEqual(bits.words.shape, (pygliss.bitset.N_WORDS,))
+		self.assertTrue(np.array_equal(bits.steps(), [1, 63, 64, 193]))
+		self.assertEqual(bits.count(), 4)
+
+		# out of range steps share bit 0
+		bits = pygliss.bitset.ChordBitset.from_steps(np.array([-999999, pygliss.tables.FM_STEP_SENTINEL, 5]))
+		self.assertTrue(np.array_equal(bits.steps(), [0, 5]))
+
+	def test_batch(self):
+		steps = np.array([[10, 20, 30], [20, 30, 0], [40, 50, 60]])
+		mask = np.array([[True, True, True], [True, True, False], [True, True, True]])
+		bits = pygliss.bitset.ChordBitset.from_steps(steps, mask)
+		self.assertEqual(bits.shape, (3,))
+		self.assertTrue(np.array_equal(bits[1].steps(), [20, 30]))
+		self.assertTrue(np.array_equal(bits.contains(bits[1]), [True, True, False]))
+		self.assertTrue(np.array_equal(bits.common_tones(bits[0]), [3, 2, 0]))
+		self.assertTrue(np.array_equal((bits[0] | bits[2]).steps(), [10, 20, 30, 40, 50, 60]))
+		self.assertTrue(np.array_equal((bits[0] & bits[1]).steps(), [20, 30]))
+		self.assertTrue(np.array_equal(bits == bits[2], [False, False, True]))
+
+	def test_popcount(self):
+		words = np.array([[0, 1, 2 ** 64 - 1, 2 ** 63]], dtype=np.uint64)
+		self.assertEqual(pygliss.bitset.popcount(words)[0], 66)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import tempfile
+import pygliss
+import numpy as np
+
+
+class TestChordIndexMethods(unittest.TestCase):
+
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		self.chords = [rng.integers(40, 170, rng.integers(1, 7)) for _ in range(2000)]
+		self.chords[5] = np.zeros(0, dtype=np.int64)
+		self.chords[7] = np.array([-999999, 60])
+		self.queries = [rng.integers(40, 170, size) for size in [1, 3, 4, 6]]
+
+	def ranked(self, query, doublecount=True):
+		dists = pygliss.chord.get_chord_distance_matrix(query[np.newaxis], self.chords,
+			doublecount=doublecount)[0]
+		order = np.lexsort((np.arange(len(dists)), dists))
+		return order, dists[order]
+
+	def test_knn(self):
+		index = pygliss.chord_index.ChordIndex(self.chords)
+		self.assertEqual(len(index), len(self.chords))
+		for query in self.queries + [np.array([-999999, 80])]:
+			order, dists = self.ranked(query)
+			ids, found = index.knn(query, 10)
+			self.assertTrue(np.array_equal(ids, order[:10]))
+			self.assertTrue(np.array_equal(found, dists[:10]))
+
+	def test_radius(self):
+		index = pygliss.chord_index.ChordIndex(self.chords)
+		for query in self.queries:
+			for doublecount in [True, False]:
+				order, dists = self.ranked(query, doublecount)
+				ids, found = index.radius(query, 5, doublecount)
+				self.assertTrue(np.array_equal(ids, order[dists <= 5]))
+				self.assertTrue(np.array_equal(found, dists[dists <= 5]))
+
+	def test_chord_queries(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = [pygliss.chord.Chord(note_vector[[60, 64, 67]]), pygliss.chord.Chord(note_vector[[60, 63, 67]]),
+			pygliss.chord.Chord(note_vector[[40, 90]])]
+		index = pygliss.chord_index.ChordIndex(chords)
+		query = pygliss.chord.Chord(note_vector[[60, 64, 68]])
+		ids, dists = index.knn(query, 3)
+		self.assertTrue(np.array_equal(ids, [0, 1, 2]))
+		self.assertTrue(np.array_equal(dists, [query.distance(chords[i]) for i in ids]))
+
+	def test_add(self):
+		index = pygliss.chord_index.ChordIndex(self.chords[:500])
+		self.assertTrue(np.array_equal(index.add(self.chords[500:]), np.arange(500, len(self.chords))))
+		for query in self.queries:
+			order, dists = self.ranked(query)
+			ids, found = index.knn(query, 5)
+			self.assertTrue(np.array_equal(ids, order[:5]))
+
+	def test_save_load(self):
+		index = pygliss.chord_index.ChordIndex(self.chords)
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			path = os.path.join(tmp_dir, "index.npz")
+			index.save(path)
+			loaded = pygliss.chord_index.ChordIndex.load(path)
+		self.assertTrue(np.array_equal(loaded.steps, index.steps))
+		self.assertTrue(np.array_equal(loaded.lengths, index.lengths))
+		for query in self.queries:
+			self.assertTrue(np.array_equal(loaded.knn(query, 10)[0], index.knn(query, 10)[0]))
+
+
+	def test_scaling(self):
+		rng = np.random.default_rng(1)
+		queries = rng.integers(40, 170, (5, 4))
+		scored = []
+		for n_chords in [10000, 40000]:
+			chords = rng.integers(40, 170, (n_chords, 4))
+			index = pygliss.chord_index.ChordIndex(chords)
+			for query in queries:
+				dists = pygliss.chord.get_chord_distance_matrix(query[np.newaxis], chords)[0]
+				order = np.lexsort((np.arange(n_chords), dists))
+				self.assertTrue(np.array_equal(index.knn(query, 10)[0], order[:10]))
+			scored.append(np.mean([len(index._search(query, 10, np.inf, True)[0]) for query in queries]))
+		# a small share of the collection is scored, and it grows slower than
+		# the collection, four times larger
+		self.assertLess(scored[1], 40000 / 10)
+		self.assertLess(scored[1] / scored[0], 3)
+
+if __name__ == '__main__':
+    unittest.main()
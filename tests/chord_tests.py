@@ -1,4 +1,7 @@
 import unittest
+import itertools
+import warnings
+import tracemalloc
 import pygliss
 from music21 import pitch
 import numpy as np
@@ -234,7 +237,272 @@ class TestChordMethods(unittest.TestCase):
 		self.assertEqual(fm_solutions[31]['fm_chord'].modulator, modulator)
 		self.assertEqual(fm_solutions[31]['roughness'], fm_test_chord.roughness())
 
-
+	def test_nearest_fm_chords(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = [note_vector[[60, 84, 98]], note_vector[[100, 124]], 
+			np.array([151.6, 261.6, 371.6, 500.0])]
+		padded = np.zeros((len(chords) + 1, 4))
+		for i, chord in enumerate(chords):
+			padded[i, :len(chord)] = chord
+		lengths = np.array([3, 2, 4, 0])
+
+		batch_solutions = pygliss.chord.nearest_fm_chords(padded, lengths, max_bytes=4096)
+		self.assertEqual(len(batch_solutions), 4)
+		self.assertEqual(batch_solutions[3], [])
+		for chord, solutions in zip(chords, batch_solutions):
+			expected = pygliss.chord.nearest_fm_chord(chord)
+			self.assertEqual(len(solutions), len(expected))
+			for sol, exp in zip(solutions, expected):
+				self.assertEqual(sol['min_steps'], exp['min_steps'])
+				self.assertEqual(sol['roughness'], exp['roughness'])
+				self.assertEqual(sol['fm_chord'].carrier, exp['fm_chord'].carrier)
+				self.assertEqual(sol['fm_chord'].modulator, exp['fm_chord'].modulator)
+
+	def test_nearest_fm_chords_sequence(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = np.array([note_vector[[60, 84, 98]], note_vector[[61, 84, 99]]])
+		seq = pygliss.sequence.ChordSequence(chords, np.array([0, 0.5]), np.array([0.5, 0.5]))
+		batch_solutions = pygliss.chord.nearest_fm_chords(seq)
+		for chord, solutions in zip(chords, batch_solutions):
+			expected = pygliss.chord.nearest_fm_chord(chord)
+			self.assertEqual([(sol['fm_chord'].carrier, sol['fm_chord'].modulator) for sol in solutions],
+				[(exp['fm_chord'].carrier, exp['fm_chord'].modulator) for exp in expected])
+
+	def test_nearest_fm_chords_loop(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		rng = np.random.default_rng(6)
+		chords = note_vector[rng.integers(40, 90, (200, 3))]
+		max_bytes = 1 << 20
+		pygliss.chord.FM_RESULTS.clear()
+		tracemalloc.start()
+		solutions = pygliss.chord.nearest_fm_chords(chords[:50], max_bytes=max_bytes)
+		current, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		# the temporary arrays stay near the budget, the solutions are kept
+		self.assertLess(peak - current, 2 * max_bytes)
+		self.assertEqual(len(solutions), 50)
+		batch_solutions = pygliss.chord.nearest_fm_chords(chords, max_bytes=max_bytes)
+
+		# the assignment distance is slower, a few chords are enough
+		assigned = pygliss.chord.nearest_fm_chords(chords[:20], max_bytes=max_bytes, 
+			doublecount=False)
+		pygliss.chord.FM_RESULTS.clear()
+		for doublecount, batch in [(True, batch_solutions), (False, assigned)]:
+			for chord, solutions in zip(chords, batch):
+				expected = pygliss.chord.nearest_fm_chord(chord, doublecount=doublecount)
+				self.assertEqual([(sol['fm_chord'].carrier, sol['fm_chord'].modulator, 
+					sol['min_steps']) for sol in solutions], [(exp['fm_chord'].carrier, 
+					exp['fm_chord'].modulator, exp['min_steps']) for exp in expected])
+
+	def test_k_nearest_fm_chords(self):
+		chord = pygliss.note.NOTE_VECTOR[[60, 84, 98, 110]]
+		nearest = pygliss.chord.nearest_fm_chord(chord)
+		min_steps = nearest[0]['min_steps']
+
+		within = pygliss.chord.k_nearest_fm_chords(chord, max_dist=min_steps)
+		self.assertEqual([(sol['fm_chord'].carrier, sol['fm_chord'].modulator) for sol in within],
+			[(sol['fm_chord'].carrier, sol['fm_chord'].modulator) for sol in nearest])
+
+		top = pygliss.chord.k_nearest_fm_chords(chord, k=len(nearest) + 10)
+		self.assertEqual(len(top), len(nearest) + 10)
+		self.assertEqual([sol['roughness'] for sol in top[:len(nearest)]], 
+			[sol['roughness'] for sol in nearest])
+		keys = [(sol['min_steps'], sol['roughness']) for sol in top]
+		self.assertEqual(keys, sorted(keys))
+		self.assertTrue(all(sol['min_steps'] > min_steps for sol in top[len(nearest):]))
+
+	def test_k_nearest_fm_chords_args(self):
+		with self.assertRaises(ValueError):
+			pygliss.chord.k_nearest_fm_chords(np.array([440.0]))
+
+	def test_fm_sidebands(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		fm_chord = pygliss.chord.FMChord(note_vector[[60, 84]], 880.0, 110.0, sidebands=5)
+		self.assertTrue(np.array_equiv(fm_chord.sum_tones(), [880.0 + i * 110.0 for i in range(1, 6)]))
+		self.assertTrue(np.array_equiv(fm_chord.diff_tones(), [abs(880.0 - i * 110.0) for i in range(1, 6)]))
+		self.assertEqual(len(fm_chord.fm_tones()), 10)
+		self.assertTrue(np.isclose(fm_chord.roughness(), pygliss.chord.calc_roughness(fm_chord.fm_tones())))
+		with self.assertRaises(ValueError):
+			pygliss.chord.FMChord(note_vector[[60, 84]], 880.0, 110.0, sidebands=-3)
+		with self.assertRaises(ValueError):
+			pygliss.chord.nearest_fm_chord(np.array([440.0]), sidebands=-3)
+
+		solutions = pygliss.chord.nearest_fm_chord(note_vector[[60, 84, 98]], sidebands=5)
+		for sol in solutions:
+			self.assertEqual(sol['fm_chord'].sidebands, 5)
+			self.assertEqual(sol['roughness'], sol['fm_chord'].roughness())
+			fm_steps = pygliss.note.find_note_vector_position_vectorized(
+				np.append(sol['fm_chord'].fm_tones(), sol['fm_chord'].carrier))
+			self.assertEqual(sol['min_steps'], pygliss.chord.get_chord_distance(
+				pygliss.note.find_note_vector_position_vectorized(note_vector[[60, 84, 98]]), fm_steps))
+
+	def test_nearest_ot_chords(self):
+		chords = [np.array([261.63, 329.63, 392.0]), np.array([440.0, 10.0, 554.37]),
+			np.array([261.63, 277.18, 293.66, 311.13])]
+		padded = np.zeros((len(chords) + 1, 4))
+		for i, chord in enumerate(chords):
+			padded[i, :len(chord)] = chord
+		lengths = np.array([3, 3, 4, 0])
+
+		for tiebreak in [None, "lowest"]:
+			ot_chords = pygliss.chord.nearest_ot_chords(padded, 12, lengths, tiebreak, max_bytes=4096)
+			self.assertEqual(len(ot_chords), 4)
+			self.assertIsNone(ot_chords[3])
+			for chord, ot in zip(chords, ot_chords):
+				expected = pygliss.chord.nearest_ot_chord(chord, 12, tiebreak)
+				self.assertTrue(np.array_equal(ot.notes, expected.notes))
+				self.assertEqual(ot.fundamental, expected.fundamental)
+
+	def test_chord_partials(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		ot = pygliss.chord.OvertoneChord(note_vector[[48, 72, 86, 96]], note_vector[24])
+		self.assertTrue(np.array_equal(ot.chord_partials(m=8), note_vector[[48, 72, 86, 96]]))
+		self.assertTrue(np.array_equal(ot.chord_partials(m=8, return_partials=True), [2, 4, 6, 8]))
+		self.assertTrue(np.array_equal(ot.chord_partials(m=3, return_partials=True), [2]))
+
+		# fundamentals off the tempered scale give the same partials
+		detuned = pygliss.chord.OvertoneChord(ot.notes, note_vector[24] * 1.001)
+		self.assertTrue(np.array_equal(detuned.chord_partials(m=8, return_partials=True), [2, 4, 6, 8]))
+
+	def test_common_tones(self):
+		notes = np.array([60, 84, 98, 110])
+		tones = np.array([120, 98, 60, 98, 61, 60])
+		expected, _, first = np.intersect1d(notes, tones, return_indices=True)
+		shared, found = pygliss.chord.common_tones(notes, tones)
+		self.assertTrue(np.array_equal(shared, expected))
+		self.assertTrue(np.array_equal(found, first))
+
+	def test_nearest_fm_chord_exact(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		steps = pygliss.tables.expand_steps(pygliss.tables.fm_spectra_steps()[80, :3, 30])
+		solutions = pygliss.chord.nearest_fm_chord(note_vector[steps])
+		self.assertTrue(all(sol['min_steps'] == 0 for sol in solutions))
+		self.assertIn((note_vector[80], note_vector[30]),
+			[(sol['fm_chord'].carrier, sol['fm_chord'].modulator) for sol in solutions])
+
+	def test_chord_distance_matrix(self):
+		rng = np.random.default_rng(0)
+		chords1 = [rng.integers(1, 194, size) for size in [3, 1, 6, 4, 0]]
+		chords2 = [rng.integers(1, 194, size) for size in [2, 5, 3]]
+		chords2[1][0] = -999999
+		expected = np.array([[pygliss.chord.get_chord_distance(a, b) for b in chords2] for a in chords1])
+		self.assertTrue(np.array_equal(pygliss.chord.get_chord_distance_matrix(chords1, chords2), expected))
+		self.assertTrue(np.array_equal(pygliss.chord.get_chord_distance_matrix(chords1, chords2, max_bytes=256), expected))
+
+		padded = np.zeros((len(chords1), 6), dtype=np.int64)
+		for i, chord in enumerate(chords1):
+			padded[i, :len(chord)] = chord
+		lengths = np.array([len(chord) for chord in chords1])
+		self.assertTrue(np.array_equal(pygliss.chord.get_chord_distance_matrix(padded, chords2, lengths), expected))
+
+	def test_padded_steps(self):
+		steps, lengths = pygliss.chord.padded_steps([np.array([70, 60]), np.zeros(0, dtype=np.int64),
+			pygliss.chord.Chord(pygliss.note.NOTE_VECTOR[[90, 80, 85]])])
+		self.assertTrue(np.array_equal(steps, [[60, 70, 0], [0, 0, 0], [80, 85, 90]]))
+		self.assertTrue(np.array_equal(lengths, [2, 0, 3]))
+		steps, lengths = pygliss.chord.padded_steps(np.array([[5, 3, 9], [7, 1, 4]]), [2, 3])
+		self.assertTrue(np.array_equal(steps, [[3, 5, 0], [1, 4, 7]]))
+		self.assertTrue(np.array_equal(lengths, [2, 3]))
+
+	def test_chord_distance_matrix_chords(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = [pygliss.chord.Chord(note_vector[[60, 68, 74]]), pygliss.chord.Chord(note_vector[[60, 67, 74]]),
+			pygliss.chord.Chord(note_vector[[50, 90]])]
+		dists = pygliss.chord.get_chord_distance_matrix(chords, chords)
+		for i, a in enumerate(chords):
+			for j, b in enumerate(chords):
+				self.assertEqual(dists[i, j], a.distance(b))
+
+	def test_assignment_distance(self):
+		def brute_force(a, b):
+			smaller, larger = (b, a) if len(a) > len(b) else (a, b)
+			return min(sum(abs(x - y) for x, y in zip(smaller, perm))
+				for perm in itertools.permutations(larger, len(smaller)))
+
+		rng = np.random.default_rng(1)
+		chords1 = [rng.integers(1, 194, size) for size in [3, 1, 5, 4]]
+		chords2 = [rng.integers(1, 194, size) for size in [2, 5, 3]]
+		expected = np.array([[brute_force(a, b) for b in chords2] for a in chords1])
+		for i, a in enumerate(chords1):
+			for j, b in enumerate(chords2):
+				self.assertEqual(pygliss.chord.get_chord_distance(a, b, doublecount=False), expected[i, j])
+		self.assertTrue(np.array_equal(pygliss.chord.get_chord_distance_matrix(chords1, chords2,
+			doublecount=False), expected))
+		self.assertTrue(np.array_equal(pygliss.chord.get_chord_distances(chords1[2], np.array(chords2[1:2] * 2),
+			doublecount=False), expected[2, [1, 1]]))
+		self.assertEqual(pygliss.chord.get_chord_distance(np.array([60, 62]), np.array([61, 90]), False), 29)
+		self.assertEqual(pygliss.chord.get_chord_distance(np.array([60, 62]), np.array([61, 90])), 2)
+
+	def test_nearest_fm_chord_assignment(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chord = note_vector[[60, 61, 84, 98]]
+		chord_steps = pygliss.note.find_note_vector_position_vectorized(chord)
+		fm_steps = pygliss.tables.expand_steps(pygliss.tables.fm_spectra_steps())
+		dists = pygliss.chord.get_chord_distances(chord_steps,
+			np.swapaxes(fm_steps, 1, 2).reshape(-1, fm_steps.shape[1]), doublecount=False)
+		solutions = pygliss.chord.nearest_fm_chord(chord, doublecount=False)
+		self.assertEqual(len(solutions), np.count_nonzero(dists == dists.min()))
+		for sol in solutions:
+			self.assertEqual(sol['min_steps'], dists.min())
+
+	def test_nearest_ot_chord_doublecount(self):
+		chords = [np.array([261.63, 329.63, 392.0]), np.array([261.63, 277.18, 293.66, 311.13])]
+		for chord in chords:
+			ot = pygliss.chord.nearest_ot_chord(chord, 12, doublecount=True)
+			self.assertEqual(len(ot.notes), len(chord))
+			steps = pygliss.note.find_note_vector_position_vectorized(chord)
+			best = pygliss.chord.get_chord_distance(steps, ot.steps)
+			# every overtone chord of the chord scores at least as far
+			for i in range(len(chord)):
+				for sub in range(1, 13):
+					fundamental = pygliss.note.NOTE_VECTOR[
+						pygliss.note.find_note_vector_position_vectorized(chord[i] / sub)]
+					candidate = pygliss.note.find_note_vector_position_vectorized(
+						np.rint(chord / fundamental) * fundamental)
+					self.assertLessEqual(best, pygliss.chord.get_chord_distance(steps, candidate))
+		batch = pygliss.chord.nearest_ot_chords(np.array([chords[0]]), 12, doublecount=True)
+		self.assertTrue(np.array_equal(batch[0].notes,
+			pygliss.chord.nearest_ot_chord(chords[0], 12, doublecount=True).notes))
+
+	def test_filter_fm_ot_chords_parallel(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = [pygliss.chord.Chord(note_vector[steps]) for steps in
+			[[60, 84, 98], [62, 84, 98], [62, 86, 98], [50, 74, 98], [70, 90, 110]]]
+		summary = lambda solutions: [(sol["idx"], [(cand["type"], tuple(cand["chord"].notes), cand["roughness"])
+			for cand in sol["candidates"]]) for sol in solutions]
+		serial = pygliss.chord.filter_fm_ot_chords(chords, ot_dist=4, fm_roughness=100)
+		parallel = pygliss.chord.filter_fm_ot_chords(chords, ot_dist=4, fm_roughness=100, workers=2, chunksize=2)
+		self.assertEqual(summary(parallel), summary(serial))
+		with self.assertRaises(AttributeError):
+			pygliss.chord.filter_fm_ot_chords(chords[:2] + [None], workers=2, chunksize=1)
+
+	def test_filter_fm_ot_sequence(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = note_vector[[[61, 67, 75], [40, 55, 62], [61, 67, 75], [75, 61, 67], [40, 46, 62], [40, 55, 62]]]
+		chords[4, 1] = 0.0
+		sequence = pygliss.sequence.ChordSequence(chords, np.arange(len(chords)), np.arange(len(chords)) + 1.0)
+		summary = lambda solutions: [(sol["idx"], [(cand["type"], type(cand["chord"]), tuple(cand["chord"].notes),
+			cand["chord"].duration, cand["roughness"], cand["full_roughness"]) for cand in sol["candidates"]])
+			for sol in solutions]
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore")
+			expected = pygliss.chord.filter_fm_ot_chords(sequence.to_chord(), ot_dist=4, fm_roughness=30)
+			solutions = pygliss.chord.filter_fm_ot_sequence(sequence, ot_dist=4, fm_roughness=30)
+		self.assertEqual(summary(solutions), summary(expected))
+		# rows 0 and 2 hold the same chord but get their own candidate chords
+		for first, repeated in zip(solutions[0]["candidates"], solutions[2]["candidates"]):
+			self.assertIsNot(first["chord"], repeated["chord"])
+		self.assertEqual(solutions[2]["candidates"][-2]["chord"].duration, 3.0)
+
+		# a silent row has no candidates, the rows around it keep theirs
+		chords[3] = 0.0
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore")
+			expected = pygliss.chord.filter_fm_ot_chords([pygliss.chord.Chord(chord) for chord in chords],
+				ot_dist=4, fm_roughness=30)
+			solutions = pygliss.chord.filter_fm_ot_sequence(chords, ot_dist=4, fm_roughness=30)
+		self.assertEqual(summary(solutions), summary(expected))
+		self.assertEqual([sol["idx"] for sol in solutions], [0, 1, 2, 4, 5])
 
 
 
@@ -0,0 +1,74 @@
+import unittest
+import pygliss
+import numpy as np
+
+
+def naive_dtw(chords1, chords2, lo=None, hi=None):
+	steps = lambda row: np.sort(pygliss.note.find_note_vector_position_vectorized(row[row > 0]))
+	table = np.full((len(chords1) + 1, len(chords2) + 1), np.inf)
+	table[0, 0] = 0
+	for i in range(len(chords1)):
+		for j in range(len(chords2)):
+			if lo is not None and not lo[i] <= j <= hi[i]:
+				continue
+			cost = pygliss.chord.get_chord_distance(steps(chords1[i]), steps(chords2[j]))
+			table[i + 1, j + 1] = cost + min(table[i, j], table[i, j + 1], table[i + 1, j])
+	return table[-1, -1]
+
+
+class TestDTWMethods(unittest.TestCase):
+
+	def setUp(self):
+		self.rng = np.random.default_rng(0)
+
+	def sequence(self, length):
+		chords = pygliss.note.NOTE_VECTOR[self.rng.integers(40, 120, (length, 3))]
+		chords[self.rng.random(chords.shape) < 0.2] = 0.0
+		return chords
+
+	def test_dtw(self):
+		chords1, chords2 = self.sequence(8), self.sequence(11)
+		path, cost = pygliss.dtw.dtw(chords1, chords2)
+		self.assertEqual(cost, naive_dtw(chords1, chords2))
+		self.assertTrue(np.array_equal(path[0], [0, 0]))
+		self.assertTrue(np.array_equal(path[-1], [7, 10]))
+		moves = np.diff(path, axis=0)
+		self.assertTrue(np.all((moves >= 0) & (moves <= 1)) and np.all(moves.sum(axis=1) > 0))
+
+		steps = lambda row: np.sort(pygliss.note.find_note_vector_position_vectorized(row[row > 0]))
+		self.assertEqual(cost, sum(pygliss.chord.get_chord_distance(steps(chords1[i]), steps(chords2[j]))
+			for i, j in path))
+
+	def test_identical_sequences(self):
+		chords = self.sequence(6)
+		sequence = pygliss.sequence.ChordSequence(chords, np.arange(6), np.ones(6))
+		path, cost = pygliss.dtw.dtw(sequence, sequence, window=1)
+		self.assertEqual(cost, 0)
+		self.assertTrue(np.array_equal(path, np.stack([np.arange(6)] * 2, axis=1)))
+
+	def test_window(self):
+		chords1 = self.sequence(9)
+		for length in [4, 9, 20]:
+			chords2 = self.sequence(length)
+			for window in [0, 2]:
+				lo, hi = pygliss.dtw._band(9, np.array([length]), window)
+				path, cost = pygliss.dtw.dtw(chords1, chords2, window)
+				self.assertEqual(cost, naive_dtw(chords1, chords2, lo[0], hi[0]))
+				self.assertTrue(np.all((path[:, 1] >= lo[0][path[:, 0]]) & (path[:, 1] <= hi[0][path[:, 0]])))
+
+	def test_dtw_batch(self):
+		query = self.sequence(7)
+		sequences = [self.sequence(length) for length in [3, 7, 12]]
+		for window in [None, 1]:
+			costs, paths = pygliss.dtw.dtw_batch(query, sequences, window, return_paths=True)
+			for chords, cost, path in zip(sequences, costs, paths):
+				expected_path, expected_cost = pygliss.dtw.dtw(query, chords, window)
+				self.assertEqual(cost, expected_cost)
+				self.assertTrue(np.array_equal(path, expected_path))
+			self.assertTrue(np.array_equal(pygliss.dtw.dtw_batch(query, sequences, window, max_bytes=512), costs))
+		with self.assertRaises(ValueError):
+			pygliss.dtw.dtw_batch(query, [np.zeros((0, 3))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import pygliss
+import numpy as np
+
+
+class TestFingerprintMethods(unittest.TestCase):
+
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		self.steps = rng.integers(60, 80, (500, 3))
+		self.chords = pygliss.note.NOTE_VECTOR[self.steps]
+		self.chords[::7, 1] = 0.0
+		self.sets = [tuple(sorted(row[chord > 0])) for row, chord in zip(self.steps, self.chords)]
+
+	def test_chord_fingerprints(self):
+		fingerprints, transposed, roots = pygliss.fingerprint.chord_fingerprints(self.chords)
+		self.assertEqual(fingerprints.shape, self.steps.shape)
+		for i in [0, 7, 13]:
+			self.assertEqual(tuple(fingerprints[i][fingerprints[i] >= 0]), self.sets[i])
+			self.assertEqual(roots[i], min(self.sets[i]))
+			self.assertEqual(tuple(transposed[i][transposed[i] >= 0]),
+				tuple(step - roots[i] for step in self.sets[i]))
+
+		silent = pygliss.fingerprint.chord_fingerprints(np.zeros((1, 3)))
+		self.assertTrue((silent[0] == -1).all())
+		self.assertEqual(silent[2][0], -1)
+
+	def test_occurrences(self):
+		sequence = pygliss.sequence.ChordSequence(self.chords, np.arange(len(self.chords)), np.ones(len(self.chords)))
+		index = pygliss.fingerprint.FingerprintIndex([sequence, self.chords[:50]])
+		for i in [3, 7]:
+			expected = [row for row, chord in enumerate(self.sets) if chord == self.sets[i]]
+			found = index.occurrences(self.chords[i])
+			self.assertTrue(np.array_equal(found[found[:, 0] == 0, 1], expected))
+			self.assertTrue(np.array_equal(found[found[:, 0] == 1, 1], [row for row in expected if row < 50]))
+		self.assertEqual(index.occurrences(np.array([1000.123])).shape, (0, 2))
+
+	def test_transposed_occurrences(self):
+		index = pygliss.fingerprint.FingerprintIndex()
+		self.assertEqual(index.add(self.chords), 0)
+		intervals = [tuple(step - min(chord) for step in chord) for chord in self.sets]
+		query = pygliss.chord.Chord(pygliss.note.NOTE_VECTOR[self.steps[3] + 5])
+		found = index.occurrences(query, transposed=True)
+		expected = [row for row, chord in enumerate(intervals) if chord == intervals[3]]
+		self.assertTrue(np.array_equal(found[:, 1], expected))
+		self.assertTrue(np.array_equal(found[:, 2], [min(self.sets[row]) - min(self.steps[3]) - 5 for row in expected]))
+
+
+	def test_unison_doubling(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		index = pygliss.fingerprint.FingerprintIndex()
+		chords = note_vector[[[69, 69, 76], [69, 76, 76], [69, 76, 76], [71, 71, 78]]]
+		chords[1, 2] = 0.0
+		index.add(chords)
+		self.assertTrue(np.array_equal(index.occurrences(note_vector[[69, 69, 76]]), [[0, 0]]))
+		self.assertTrue(np.array_equal(index.occurrences(note_vector[[69, 76]]), [[0, 1]]))
+		self.assertTrue(np.array_equal(index.occurrences(note_vector[[69, 76, 76]]), [[0, 2]]))
+		self.assertTrue(np.array_equal(index.occurrences(note_vector[[60, 60, 67]], transposed=True),
+			[[0, 0, 9], [0, 3, 11]]))
+
+if __name__ == '__main__':
+    unittest.main()
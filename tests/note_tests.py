@@ -1,6 +1,7 @@
 import unittest
 import pygliss
 from music21 import pitch
+import numpy as np
 
 class TestNoteMethods(unittest.TestCase):
 
@@ -13,5 +14,21 @@ class TestNoteMethods(unittest.TestCase):
     def test_freq_to_note_2(self):
         self.assertEqual(pygliss.note.freq_to_note(133.0), pygliss.note.Note('C', 3, "+"))
 
+    def test_note_vector_position_vectorized(self):
+        note_vector = pygliss.note.NOTE_VECTOR
+        midpoints = (note_vector[1:] + note_vector[:-1]) / 2
+        freqs = np.concatenate((np.linspace(0, 5000, 2001), note_vector, midpoints,
+            [-1.0, np.inf, np.nan, 1e20]))
+        expected = [pygliss.note.find_note_vector_position(f) for f in freqs]
+        positions = pygliss.note.find_note_vector_position_vectorized(freqs)
+        self.assertTrue(np.array_equal(positions, expected))
+
+    def test_note_vector_position_vectorized_shape(self):
+        freqs = np.array([[10.0, 440.0], [880.0, 4400.0]])
+        positions = pygliss.note.find_note_vector_position_vectorized(freqs)
+        self.assertEqual(positions.shape, (2, 2))
+        self.assertEqual(positions[0, 0], -999999)
+        self.assertEqual(positions[0, 1], pygliss.note.find_note_vector_position(440.0))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+import unittest
+import os
+import tempfile
+import pygliss
+import numpy as np
+
+
+class TestResultCacheMethods(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.prev_cache_dir = os.environ.get("PYGLISS_CACHE_DIR")
+		os.environ["PYGLISS_CACHE_DIR"] = self.tmp_dir.name
+		pygliss.result_cache.clear_result_caches()
+
+	def tearDown(self):
+		pygliss.result_cache.configure_result_caches(pygliss.result_cache.RESULT_CACHE_SIZE, False)
+		pygliss.result_cache.clear_result_caches()
+		if self.prev_cache_dir is None:
+			del os.environ["PYGLISS_CACHE_DIR"]
+		else:
+			os.environ["PYGLISS_CACHE_DIR"] = self.prev_cache_dir
+		self.tmp_dir.cleanup()
+
+	def test_lru(self):
+		cache = pygliss.result_cache.ResultCache("test", maxsize=2)
+		keys = [pygliss.result_cache.result_key(np.array([i]), 3) for i in range(3)]
+		for i, key in enumerate(keys):
+			cache.put(key, (np.arange(i), np.float64(i)))
+		self.assertIsNone(cache.get(keys[0]))
+		self.assertTrue(np.array_equal(cache.get(keys[2])[0], np.arange(2)))
+		self.assertFalse(cache.get(keys[2])[0].flags.writeable)
+		self.assertEqual(cache.stats(), {"hits": 2, "disk_hits": 0, "misses": 1, "size": 2})
+		self.assertNotEqual(keys[1], pygliss.result_cache.result_key(np.array([1]), 4))
+
+	def test_disk_store(self):
+		key = pygliss.result_cache.result_key(np.array([60, 84]), 30, True)
+		cache = pygliss.result_cache.ResultCache("test", persist=True)
+		self.assertEqual(os.path.dirname(cache.path()), self.tmp_dir.name)
+		self.assertIn(pygliss.tables.cache_key(), cache.path())
+		cache.put(key, (np.array([1, 2]), np.int64(0)))
+
+		reopened = pygliss.result_cache.ResultCache("test", persist=True)
+		carriers, min_steps = reopened.get(key)
+		self.assertTrue(np.array_equal(carriers, [1, 2]))
+		self.assertEqual(min_steps, 0)
+		self.assertEqual(reopened.stats()["disk_hits"], 1)
+		reopened.get(key)
+		self.assertEqual(reopened.stats()["hits"], 1)
+
+		reopened.clear(disk=True)
+		self.assertFalse(os.path.exists(cache.path()))
+		os.environ["PYGLISS_CACHE_DIR"] = ""
+		self.assertIsNone(cache.path())
+
+	def test_nearest_fm_chord_cache(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		summary = lambda solutions: [(sol["min_steps"], sol["roughness"], sol["fm_chord"].carrier,
+			sol["fm_chord"].modulator, tuple(sol["fm_chord"].notes)) for sol in solutions]
+		first = pygliss.chord.nearest_fm_chord(note_vector[[60, 84, 99]], sidebands=8)
+		# another chord on the same steps reuses the search
+		detuned = note_vector[[60, 84, 99]] * 1.001
+		second = pygliss.chord.nearest_fm_chord(detuned, sidebands=8)
+		self.assertEqual(pygliss.chord.FM_RESULTS.stats()["hits"], 1)
+		self.assertEqual([sol[:4] for sol in summary(first)], [sol[:4] for sol in summary(second)])
+		self.assertTrue(np.array_equal(second[0]["fm_chord"].notes, detuned))
+
+		pygliss.chord.FM_RESULTS.clear()
+		self.assertEqual(summary(pygliss.chord.nearest_fm_chord(note_vector[[60, 84, 99]], sidebands=8)), summary(first))
+
+	def test_persisted_results(self):
+		pygliss.result_cache.configure_result_caches(persist=True)
+		chord = np.array([261.63, 329.63, 392.0])
+		ot = pygliss.chord.nearest_ot_chord(chord, 12)
+		fm = pygliss.chord.nearest_fm_chord(chord)
+		pygliss.result_cache.clear_result_caches()
+
+		cached_ot = pygliss.chord.nearest_ot_chord(chord, 12)
+		cached_fm = pygliss.chord.nearest_fm_chord(chord)
+		info = pygliss.result_cache.result_cache_info()
+		self.assertEqual(info["nearest_ot_chord"]["disk_hits"], 1)
+		self.assertEqual(info["nearest_fm_chord"]["disk_hits"], 1)
+		self.assertTrue(np.array_equal(cached_ot.notes, ot.notes))
+		self.assertEqual(cached_ot.fundamental, ot.fundamental)
+		self.assertEqual([(sol["min_steps"], sol["fm_chord"].carrier, sol["fm_chord"].modulator) for sol in cached_fm],
+			[(sol["min_steps"], sol["fm_chord"].carrier, sol["fm_chord"].modulator) for sol in fm])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import pygliss
+import numpy as np
+
+class TestRoughnessMethods(unittest.TestCase):
+
+	def test_unison_roughness(self):
+		self.assertEqual(pygliss.roughness.calc_roughness(np.array([440.0, 440.0])), 0.0)
+
+	def test_pair_roughness(self):
+		chord = np.array([440.0, 466.16, 493.88])
+		pairs = pygliss.roughness.pair_roughness(chord[[0, 0, 1]], chord[[1, 2, 2]])
+		self.assertEqual(pygliss.roughness.calc_roughness(chord), np.sum(pairs))
+		self.assertTrue(pairs[0] > pairs[1])
+
+	def test_pair_roughness_amplitudes(self):
+		loud = pygliss.roughness.pair_roughness(440.0, 466.16)
+		soft = pygliss.roughness.pair_roughness(440.0, 466.16, 0.5, 0.5)
+		self.assertTrue(np.isclose(soft, loud * 0.25 ** 0.1))
+
+	def test_long_chords(self):
+		chord = np.linspace(100.0, 4000.0, 80)
+		first, second = pygliss.roughness.pair_indices(80)
+		self.assertEqual(len(first), 80 * 79 // 2)
+		self.assertEqual(pygliss.roughness.calc_roughness(chord),
+			np.sum(pygliss.roughness.pair_roughness(chord[first], chord[second])))
+		self.assertEqual(pygliss.roughness.calc_roughness(np.array([440.0])), 0.0)
+
+	def test_quantized_roughness(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		steps = np.array([60, 61, 84, 98, 99])
+		self.assertEqual(pygliss.roughness.quantized_roughness(steps),
+			pygliss.roughness.calc_roughness(note_vector[steps]))
+
+		amps = np.array([1.0, 0.5, 0.8, 0.3, 0.9])
+		first, second = pygliss.roughness.pair_indices(len(steps))
+		self.assertEqual(pygliss.roughness.quantized_roughness(steps, amps),
+			np.sum(pygliss.roughness.pair_roughness(note_vector[steps][first], 
+				note_vector[steps][second], amps[first], amps[second])))
+
+		# silent steps add no roughness
+		self.assertEqual(pygliss.roughness.quantized_roughness(np.array([60, -999999, 61])),
+			pygliss.roughness.calc_roughness(note_vector[[60, 61]]))
+
+		batch = np.array([[60, 61, 84], [98, 99, 120]])
+		self.assertTrue(np.array_equal(pygliss.roughness.quantized_roughness(batch),
+			[pygliss.roughness.calc_roughness(note_vector[row]) for row in batch]))
+
+	def test_batch_roughness(self):
+		chords = [np.array([440.0, 466.16, 493.88]), np.array([261.63, 277.18]),
+			np.array([100.0]), np.array([220.0, 233.08, 246.94, 261.63])]
+		padded = np.zeros((len(chords), 4))
+		for i, chord in enumerate(chords):
+			padded[i, :len(chord)] = chord
+		expected = [pygliss.roughness.calc_roughness(chord) if len(chord) > 1 else 0.0 for chord in chords]
+
+		self.assertTrue(np.allclose(pygliss.roughness.batch_roughness(padded, max_bytes=256), expected))
+		self.assertTrue(np.allclose(pygliss.roughness.batch_roughness(chords), expected))
+		lengths = np.array([2, 2, 1, 4])
+		self.assertTrue(np.isclose(pygliss.roughness.batch_roughness(padded, lengths)[0],
+			pygliss.roughness.calc_roughness(chords[0][:2])))
+
+		offsets = np.cumsum([0] + [len(chord) for chord in chords])
+		self.assertTrue(np.allclose(pygliss.roughness.ragged_roughness(np.concatenate(chords), offsets), expected))
+
+	def test_batch_roughness_silence(self):
+		seq = pygliss.sequence.ChordSequence(np.array([[440.0, 466.16], [261.63, 277.18]]),
+			np.array([0, 1.0]), np.array([1.0, 1.0]))
+		seq.add_offset_at_position(0.5, 1)
+		roughness = pygliss.roughness.batch_roughness(seq)
+		self.assertEqual(len(roughness), 3)
+		self.assertEqual(roughness[1], 0.0)
+		self.assertTrue(np.isclose(roughness[2], pygliss.roughness.calc_roughness(seq.chords[2])))
+
+	def test_roughness_timeline(self):
+		rng = np.random.default_rng(0)
+		chords = np.repeat(rng.uniform(100.0, 2000.0, (1, 12)), 40, axis=0)
+		for row in range(1, 40):
+			chords[row:, row % 12] = rng.uniform(100.0, 2000.0)
+		chords[10:, 3] = 0.0
+		chords[20] = 0.0
+
+		expected = pygliss.roughness.batch_roughness(chords)
+		for refresh in [1, 7, 256]:
+			self.assertTrue(np.allclose(pygliss.roughness.roughness_timeline(chords, refresh), expected))
+		self.assertEqual(pygliss.roughness.roughness_timeline(chords)[20], 0.0)
+
+	def test_gliss_cmpr_roughness(self):
+		note_matrix = np.array([[261.63, 523.25], [329.63, 392.0], [392.0, 196.0]])
+		cmpr = pygliss.gliss_cmpr.make_gliss_cmpr_sequence(note_matrix)[0]
+		self.assertTrue(np.allclose(cmpr.roughness(), [pygliss.roughness.calc_roughness(chord) for chord in cmpr.chords]))
+
+	def test_spectral_roughness(self):
+		chord = np.array([220.0, 277.18, 329.63, 415.3])
+		# one partial per note is the pure tone roughness
+		self.assertTrue(np.isclose(pygliss.roughness.spectral_roughness(chord, 1),
+			pygliss.roughness.calc_roughness(chord)))
+
+		numbers = np.arange(1, 9)
+		tones = (chord[:, np.newaxis] * numbers).ravel()
+		amps = np.tile(numbers ** -1.0, len(chord))
+		first, second = pygliss.roughness.pair_indices(len(tones))
+		full = np.sum(pygliss.roughness.pair_roughness(tones[first], tones[second], amps[first], amps[second]))
+		self.assertTrue(np.isclose(pygliss.roughness.spectral_roughness(chord, 8, bandwidths=np.inf), full))
+		self.assertTrue(np.isclose(pygliss.roughness.spectral_roughness(chord, 8), full, rtol=1e-4))
+		self.assertTrue(pygliss.roughness.spectral_roughness(chord, 8, rolloff=2.0) < 
+			pygliss.roughness.spectral_roughness(chord, 8, rolloff=0.5))
+
+	def test_batch_spectral_roughness(self):
+		chords = np.array([[220.0, 277.18, 0.0], [440.0, 466.16, 493.88], [0.0, 0.0, 0.0]])
+		expected = [pygliss.roughness.spectral_roughness(chord[chord != 0.0], 6, 0.5) for chord in chords]
+		self.assertTrue(np.allclose(pygliss.roughness.batch_roughness(chords, partials=6, rolloff=0.5, max_bytes=256), expected))
+		self.assertEqual(pygliss.roughness.batch_roughness(chords, partials=6)[2], 0.0)
+
+		fm_chord = pygliss.chord.FMChord(np.array([440.0]), 440.0, 110.0, sidebands=4)
+		self.assertTrue(np.isclose(fm_chord.roughness(partials=6), 
+			pygliss.roughness.spectral_roughness(fm_chord.fm_tones(), 6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
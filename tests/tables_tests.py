@@ -0,0 +1,186 @@
+import unittest
+import multiprocessing
+import os
+import tempfile
+from multiprocessing import shared_memory
+import pygliss
+import numpy as np
+
+
+def shared_steps_worker(carrier):
+	steps = pygliss.tables.fm_spectra_steps()
+	return int(steps[carrier].sum()), isinstance(steps, np.memmap), steps.flags.writeable
+
+class TestTablesMethods(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp_dir = tempfile.TemporaryDirectory()
+		self.prev_cache_dir = os.environ.get("PYGLISS_CACHE_DIR")
+		os.environ["PYGLISS_CACHE_DIR"] = self.tmp_dir.name
+		pygliss.tables.clear_tables()
+
+	def tearDown(self):
+		pygliss.tables.clear_tables()
+		if self.prev_cache_dir is None:
+			del os.environ["PYGLISS_CACHE_DIR"]
+		else:
+			os.environ["PYGLISS_CACHE_DIR"] = self.prev_cache_dir
+		self.tmp_dir.cleanup()
+
+	def test_cache_path_keyed_by_constants(self):
+		path = pygliss.tables.cache_path("fm_spectra")
+		self.assertEqual(os.path.dirname(path), self.tmp_dir.name)
+		self.assertIn(f"v{pygliss.tables.TABLE_CACHE_VERSION}", path)
+		self.assertIn(pygliss.tables.cache_key(), path)
+
+	def test_disk_cache_round_trip(self):
+		built = pygliss.tables.get_table("fm_spectra")
+		self.assertTrue(os.path.exists(pygliss.tables.cache_path("fm_spectra")))
+
+		pygliss.tables.clear_tables()
+		loaded = pygliss.tables.get_table("fm_spectra")
+		self.assertIsInstance(loaded.base, np.memmap)
+		self.assertFalse(loaded.flags.writeable)
+		self.assertTrue(np.array_equal(built, loaded))
+
+	def test_stale_cache_files_removed(self):
+		version, key = pygliss.tables.TABLE_CACHE_VERSION, pygliss.tables.cache_key()
+		stale = [f"fm_spectra-v{version - 1}-{key}.npy", f"fm_spectra-v{version - 2}-0123456789ab.npy"]
+		kept = [f"fm_spectra-v{version}-0123456789ab.npy", f"fm_spectra_steps-v{version - 1}-{key}.npy"]
+		for name in stale + kept:
+			open(os.path.join(self.tmp_dir.name, name), "wb").close()
+		pygliss.tables.get_table("fm_spectra")
+		self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+			sorted(kept + [os.path.basename(pygliss.tables.cache_path("fm_spectra"))]))
+
+	def test_disabled_disk_cache(self):
+		os.environ["PYGLISS_CACHE_DIR"] = ""
+		self.assertIsNone(pygliss.tables.cache_path("fm_spectra"))
+		pygliss.tables.get_table("fm_spectra")
+		self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+	def test_fm_tables(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		fm_chords = pygliss.chord.FM_CHORDS_W_CARRIER
+		sidebands = pygliss.constants.MAX_SIDEBANDS
+		self.assertEqual(fm_chords.shape, (len(note_vector), sidebands * 2 + 1, len(note_vector)))
+		self.assertEqual(fm_chords[10, 0, 20], note_vector[10] + note_vector[20])
+		self.assertEqual(fm_chords[10, sidebands + 1, 20], abs(note_vector[10] - 2 * note_vector[20]))
+		self.assertEqual(fm_chords[10, -1, 20], note_vector[10])
+		steps = pygliss.chord.FM_CHORDS_W_CARRIER_STEPS
+		self.assertEqual(steps.dtype, np.int64)
+		self.assertTrue(np.array_equal(steps, pygliss.note.find_note_vector_position_vectorized(fm_chords)))
+		self.assertTrue(np.array_equal(pygliss.tables.expand_steps(pygliss.tables.fm_spectra_steps()), steps))
+
+	def test_fm_table_views(self):
+		spectra = pygliss.tables.fm_spectra()
+		for name in ["SUM_TONES", "DIFF_TONES", "FM_CHORDS", "FM_CHORDS_W_CARRIER"]:
+			self.assertTrue(np.shares_memory(getattr(pygliss.chord, name), spectra))
+		# the legacy step tables are widened copies of the int16 table
+		self.assertTrue(np.array_equal(pygliss.chord.FM_CHORDS_STEPS, pygliss.tables.expand_steps(
+			pygliss.tables.fm_spectra_steps()[:, pygliss.tables.FM_TONE_ROWS, :])))
+
+	def test_fm_spectra_float32(self):
+		spectra_32 = pygliss.tables.fm_spectra(dtype=np.float32)
+		self.assertEqual(spectra_32.dtype, np.float32)
+		# built without loading the float64 table
+		self.assertNotIn("fm_spectra", pygliss.tables.table_nbytes())
+		self.assertTrue(np.array_equal(spectra_32, pygliss.tables.fm_spectra().astype(np.float32)))
+
+	def test_table_nbytes(self):
+		pygliss.tables.fm_spectra_steps()
+		nbytes = pygliss.tables.table_nbytes()
+		self.assertEqual(nbytes["fm_spectra_steps"], pygliss.tables.fm_spectra_steps().size * 2)
+		self.assertNotIn("fm_spectra_f32", nbytes)
+
+	def test_fm_roughness(self):
+		spectra = pygliss.tables.fm_spectra()
+		sidebands = pygliss.constants.MAX_SIDEBANDS
+		for carrier, modulator in [(100, 40), (150, 3), (20, 180)]:
+			self.assertEqual(pygliss.tables.fm_roughness()[carrier, modulator],
+				pygliss.roughness.calc_roughness(spectra[carrier, :sidebands * 2, modulator]))
+			tones = np.concatenate((spectra[carrier, :5, modulator], 
+				spectra[carrier, sidebands:sidebands + 5, modulator]))
+			self.assertTrue(np.isclose(pygliss.tables.fm_roughness(5)[carrier, modulator],
+				pygliss.roughness.calc_roughness(tones)))
+
+	def test_fm_sideband_steps(self):
+		steps = pygliss.tables.fm_spectra_steps()
+		sidebands = pygliss.constants.MAX_SIDEBANDS
+		reduced = pygliss.tables.fm_sideband_steps(4)
+		self.assertIs(reduced, pygliss.tables.fm_sideband_steps(4))
+		self.assertEqual(reduced.shape, (steps.shape[0], 9, steps.shape[2]))
+		self.assertTrue(np.array_equal(reduced[:, :4], steps[:, :4]))
+		self.assertTrue(np.array_equal(reduced[:, 4:8], steps[:, sidebands:sidebands + 4]))
+		self.assertTrue(np.array_equal(reduced[:, 8], steps[:, -1]))
+		self.assertIs(pygliss.tables.fm_sideband_steps(), steps)
+		self.assertIs(pygliss.tables.fm_sideband_steps(sidebands + 10), steps)
+		self.assertIs(pygliss.tables.fm_sideband_steps(0), steps)
+		for negative in [-1, -3]:
+			with self.assertRaises(ValueError):
+				pygliss.tables.fm_sideband_steps(negative)
+			with self.assertRaises(ValueError):
+				pygliss.tables.fm_roughness(negative)
+
+	def test_fm_step_index(self):
+		steps = pygliss.tables.fm_spectra_steps()
+		offsets, pairs = pygliss.tables.fm_step_index()
+		n = len(pygliss.note.NOTE_VECTOR)
+		for step in [0, 1, 60, 114, 193]:
+			value = pygliss.tables.FM_STEP_SENTINEL if step == 0 else step
+			carriers, modulators = np.nonzero(np.any(steps == value, axis=1))
+			self.assertTrue(np.array_equal(pairs[offsets[step]:offsets[step + 1]],
+				carriers * n + modulators))
+
+	def test_harmonic_steps(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		steps = pygliss.tables.harmonic_steps()
+		self.assertEqual(steps.shape, (len(note_vector), pygliss.constants.HARMONIC_PARTIALS))
+		expected = pygliss.note.find_note_vector_position_vectorized(note_vector[60] * np.arange(1, 41))
+		self.assertTrue(np.array_equal(pygliss.tables.expand_steps(steps[60, :40]), expected))
+		self.assertEqual(pygliss.tables.harmonic_steps(12).shape, (len(note_vector), 12))
+		self.assertEqual(pygliss.tables.harmonic_steps(300).shape, (len(note_vector), 300))
+
+		fundamentals = np.array([[1], [60], [120]])
+		partials = np.array([0, 1, 7, 256, 400])
+		expected = pygliss.note.find_note_vector_position_vectorized(
+			note_vector[fundamentals] * partials.astype(np.float64))
+		self.assertTrue(np.array_equal(
+			pygliss.tables.lookup_harmonic_steps(fundamentals, partials), expected))
+
+	def test_harmonic_step_index(self):
+		steps = pygliss.tables.harmonic_steps()
+		offsets, pairs = pygliss.tables.harmonic_step_index()
+		for step in [0, 61, 100, 193]:
+			value = pygliss.tables.FM_STEP_SENTINEL if step == 0 else step
+			fundamentals, partials = np.nonzero(steps == value)
+			found = divmod(pairs[offsets[step]:offsets[step + 1]], pygliss.constants.HARMONIC_PARTIALS)
+			self.assertTrue(np.array_equal(found[0], fundamentals))
+			self.assertTrue(np.array_equal(found[1], partials))
+
+	def test_fm_step_bitsets(self):
+		steps = pygliss.tables.fm_spectra_steps()
+		bitsets = pygliss.tables.fm_step_bitsets()
+		self.assertEqual(bitsets.shape, (194, 194, pygliss.bitset.N_WORDS))
+		expected = np.unique(pygliss.bitset.step_slots(steps[80, :, 30]))
+		self.assertTrue(np.array_equal(pygliss.bitset.ChordBitset(bitsets[80, 30]).steps(), expected))
+		reduced = pygliss.bitset.ChordBitset(pygliss.tables.fm_sideband_bitsets(5)[80, 30])
+		self.assertTrue(np.array_equal(reduced.steps(),
+			np.unique(pygliss.bitset.step_slots(pygliss.tables.fm_sideband_steps(5)[80, :, 30]))))
+
+	def test_shared_tables(self):
+		steps = pygliss.tables.fm_spectra_steps()
+		with pygliss.tables.SharedTables(["fm_spectra_steps"]) as shared:
+			segment_name = shared.spec["fm_spectra_steps"][0]
+			with multiprocessing.get_context("spawn").Pool(2, shared.initializer, shared.initargs) as pool:
+				results = pool.map(shared_steps_worker, [0, 50, 100])
+		for carrier, (total, memmap, writeable) in zip([0, 50, 100], results):
+			self.assertEqual(total, int(steps[carrier].sum()))
+			self.assertFalse(memmap)
+			self.assertFalse(writeable)
+		with self.assertRaises(FileNotFoundError):
+			shared_memory.SharedMemory(segment_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import itertools
+import pygliss
+import numpy as np
+
+
+class TestVoiceLeadingMethods(unittest.TestCase):
+
+	def setUp(self):
+		rng = np.random.default_rng(0)
+		note_vector = pygliss.note.NOTE_VECTOR
+		self.candidates = [[pygliss.chord.Chord(note_vector[np.sort(rng.integers(40, 150, rng.integers(1, 5)))])
+			for _ in range(size)] for size in [2, 3, 1, 3]]
+
+	def brute_force(self, distance_weight, roughness_weight):
+		costs = {}
+		for combo in itertools.product(*[range(len(cands)) for cands in self.candidates]):
+			chords = [cands[i] for cands, i in zip(self.candidates, combo)]
+			costs[combo] = roughness_weight * sum(pygliss.roughness.calc_roughness(chord.notes) for chord in chords) + \
+				distance_weight * sum(pygliss.chord.get_chord_distance(a.steps, b.steps) for a, b in zip(chords, chords[1:]))
+		best = min(costs, key=costs.get)
+		return best, costs[best]
+
+	def test_optimal_voice_leading(self):
+		solutions = [{"candidates": [{"chord": chord} for chord in cands], "idx": idx}
+			for idx, cands in enumerate(self.candidates)]
+		for distance_weight, roughness_weight in [(1.0, 1.0), (0.0, 1.0), (1.0, 0.0), (0.5, 20.0)]:
+			choices, cost = pygliss.voice_leading.optimal_voice_leading(solutions, distance_weight, roughness_weight)
+			best, best_cost = self.brute_force(distance_weight, roughness_weight)
+			self.assertTrue(np.isclose(cost, best_cost))
+			self.assertEqual(tuple(choices), best)
+
+	def test_chord_lists(self):
+		choices, cost = pygliss.voice_leading.optimal_voice_leading(self.candidates)
+		self.assertEqual(len(choices), len(self.candidates))
+		self.assertEqual(len(pygliss.voice_leading.optimal_voice_leading([])[0]), 0)
+		with self.assertRaises(ValueError):
+			pygliss.voice_leading.optimal_voice_leading([[], self.candidates[0]])
+
+	def test_filter_fm_ot_chords(self):
+		note_vector = pygliss.note.NOTE_VECTOR
+		chords = [pygliss.chord.Chord(note_vector[steps]) for steps in [[60, 84, 98], [62, 84, 98], [62, 86, 98]]]
+		solutions = pygliss.chord.filter_fm_ot_chords(chords, ot_dist=4, fm_roughness=100)
+		choices, cost = pygliss.voice_leading.optimal_voice_leading(solutions, roughness_weight=0.0)
+		path = [sol["candidates"][choice]["chord"] for sol, choice in zip(solutions, choices)]
+		self.assertEqual(cost, sum(a.distance(b) for a, b in zip(path, path[1:])))
+
+
+if __name__ == '__main__':
+    unittest.main()